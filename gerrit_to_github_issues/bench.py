@@ -0,0 +1,134 @@
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from gerrit_to_github_issues import engine
+from gerrit_to_github_issues import gerrit
+from gerrit_to_github_issues import github_issues
+from gerrit_to_github_issues import ratelimit
+from gerrit_to_github_issues import simulator
+
+GERRIT_URL = 'review.example.com'
+
+LOG = logging.getLogger(__name__)
+
+
+def run_benchmark(changes: int, issues: int, cards: int, projects: int = 1, workers: int = 1, runs: int = 2,
+                  checkpoint: bool = False, seed: int = 0, measure_memory: bool = True) -> list:
+    """Runs ``runs`` consecutive syncs and returns one result per run.
+
+    tracemalloc slows Python down several times over, so wall time and API
+    calls come from an untraced pass and memory from a second pass over a
+    fresh copy of the same dataset. The memory figures leave out what the
+    simulated backends hold on to.
+    """
+    results = run_syncs(changes, issues, cards, projects, workers, runs, checkpoint, seed, False)
+    if measure_memory:
+        memory = run_syncs(changes, issues, cards, projects, workers, runs, checkpoint, seed, True)
+        for result, traced in zip(results, memory):
+            result['peak_memory_bytes'] = traced['peak_memory_bytes']
+            result['retained_memory_bytes'] = traced['retained_memory_bytes']
+    return results
+
+
+def run_syncs(changes: int, issues: int, cards: int, projects: int, workers: int, runs: int, checkpoint: bool,
+              seed: int, trace: bool) -> list:
+    fake_github = simulator.FakeGitHub(rate_limit=10 ** 9)
+    records, mappings = simulator.generate_dataset(fake_github, changes, issues, cards, projects, seed)
+    fake_gerrit = simulator.FakeGerrit(records)
+    gerrit.set_connection(GERRIT_URL, fake_gerrit)
+    gh = github_issues.get_client(None, None, 'simulated-token', rate_limiter=ratelimit.RateLimiter(),
+                                  session=fake_github)
+    # Allocations made by the simulated backends, e.g. the issues and
+    # comments the sync writes to them, are not the sync's own memory
+    sync_only = [tracemalloc.Filter(False, simulator.__file__)]
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        checkpoint_db = os.path.join(tmp_dir, 'checkpoint.db') if checkpoint else None
+        for run in range(1, runs + 1):
+            fake_github.calls.clear()
+            fake_gerrit.calls.clear()
+            if trace:
+                # Only allocations made from here on are traced, so the
+                # dataset and earlier runs' state are left out
+                tracemalloc.start()
+            started = time.perf_counter()
+            engine.sync(gh, GERRIT_URL, mappings, checkpoint_db=checkpoint_db, workers=workers)
+            wall_time = time.perf_counter() - started
+            result = {
+                'run': run,
+                'wall_time': round(wall_time, 3),
+                'github_calls': sum(fake_github.calls.values()),
+                'github_calls_by_endpoint': dict(fake_github.calls.most_common()),
+                'gerrit_calls': dict(fake_gerrit.calls),
+            }
+            if trace:
+                # The peak can't be broken down by file, so take out what
+                # the backends still hold at the end of the run
+                current, peak_memory = tracemalloc.get_traced_memory()
+                retained = sum(t.size for t in tracemalloc.take_snapshot().filter_traces(sync_only).traces)
+                tracemalloc.stop()
+                result['peak_memory_bytes'] = peak_memory - (current - retained)
+                result['retained_memory_bytes'] = retained
+            results.append(result)
+    gerrit.close_connections()
+    return results
+
+
+def print_report(results: list):
+    for result in results:
+        memory = ''
+        if 'peak_memory_bytes' in result:
+            memory = (f', peak memory {result["peak_memory_bytes"] / 1024 / 1024:.1f} MB, retained '
+                      f'{result["retained_memory_bytes"] / 1024 / 1024:.1f} MB')
+        print(f'Run {result["run"]}: {result["wall_time"]}s{memory}, {result["github_calls"]} GitHub calls, '
+              f'Gerrit {result["gerrit_calls"]}')
+        for endpoint, count in result['github_calls_by_endpoint'].items():
+            print(f'    {count:>7}  {endpoint}')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog='gerrit-to-github-issues-bench',
+        description='Runs a sync against simulated Gerrit and GitHub backends and reports wall time, '
+                    'API calls by endpoint and peak memory. The first run starts from an empty board state; '
+                    'later runs show the steady-state cost of a sync with nothing new to do.'
+    )
+    parser.add_argument('--changes', action='store', type=int, default=1000, help='Changes per project.')
+    parser.add_argument('--issues', action='store', type=int, default=300, help='Issues per project.')
+    parser.add_argument('--cards', action='store', type=int, default=300, help='Board cards per project.')
+    parser.add_argument('--projects', action='store', type=int, default=1, help='Number of repo mappings.')
+    parser.add_argument('-w', '--workers', action='store', type=int, default=1, help='Worker threads.')
+    parser.add_argument('--runs', action='store', type=int, default=2, help='Number of consecutive syncs.')
+    parser.add_argument('--checkpoint', action='store_true', default=False,
+                        help='Uses a checkpoint store between runs.')
+    parser.add_argument('--seed', action='store', type=int, default=0, help='Seed for the generated dataset.')
+    parser.add_argument('--json', action='store', type=str, default=None,
+                        help='Writes the results as JSON to this file.')
+    parser.add_argument('-v', '--verbose', action='store_true', default=False, help='Enables INFO level logging.')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR, stream=sys.stderr)
+
+    results = run_benchmark(args.changes, args.issues, args.cards, args.projects, args.workers, args.runs,
+                            args.checkpoint, args.seed)
+    print_report(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,123 @@
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+
+from gerrit_to_github_issues import gerrit
+
+LOG = logging.getLogger(__name__)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS cursors (
+    scope TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS changes (
+    scope TEXT NOT NULL,
+    number INTEGER NOT NULL,
+    patch_set INTEGER,
+    fingerprint TEXT NOT NULL,
+    PRIMARY KEY (scope, number)
+);
+CREATE TABLE IF NOT EXISTS issue_links (
+    scope TEXT NOT NULL,
+    number INTEGER NOT NULL,
+    target TEXT NOT NULL,
+    issue INTEGER NOT NULL,
+    wip INTEGER NOT NULL,
+    PRIMARY KEY (scope, number, target, issue)
+);
+CREATE INDEX IF NOT EXISTS issue_links_by_issue ON issue_links (target, issue);
+'''
+
+
+def change_fingerprint(change: gerrit.Change, skip_approvals: bool = False) -> str:
+    # Only the fields rendered to GitHub take part in the fingerprint, so a
+    # change is reprocessed exactly when its issue comment or labels could differ
+    payload = [
+        change.status,
+        change.subject,
+        change.commit_message,
+        change.owner_name,
+        change.owner_email,
+        change.patch_set,
+        None if skip_approvals else sorted(change.approvals),
+    ]
+    return hashlib.sha1(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class CheckpointStore:
+    """Persists sync progress between runs in a local SQLite database.
+
+    A scope identifies one Gerrit project (and its GitHub target); each scope
+    keeps the newest ``lastUpdated`` timestamp seen and a fingerprint of every
+    change it has processed. The issues each change links to, and whether it
+    is WIP, are kept too, since a run that skips unchanged changes still has
+    to plan their issues against them. The store may be shared between
+    threads.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    def get_cursor(self, scope: str) -> int:
+        with self._lock:
+            row = self.conn.execute('SELECT value FROM cursors WHERE scope = ?', (scope,)).fetchone()
+        return row[0] if row else None
+
+    def set_cursor(self, scope: str, value: int):
+        with self._lock:
+            self.conn.execute('INSERT OR REPLACE INTO cursors (scope, value) VALUES (?, ?)', (scope, value))
+            self.conn.commit()
+
+    def is_unchanged(self, scope: str, number: int, fingerprint: str) -> bool:
+        with self._lock:
+            row = self.conn.execute('SELECT fingerprint FROM changes WHERE scope = ? AND number = ?',
+                                    (scope, number)).fetchone()
+        return row is not None and row[0] == fingerprint
+
+    def record_change(self, scope: str, number: int, patch_set: int, fingerprint: str):
+        with self._lock:
+            self.conn.execute('INSERT OR REPLACE INTO changes (scope, number, patch_set, fingerprint) '
+                              'VALUES (?, ?, ?, ?)', (scope, number, patch_set, fingerprint))
+            self.conn.commit()
+
+    def set_issue_links(self, scope: str, number: int, target: str, issues: dict) -> list:
+        # Replaces the issues of target a change links to, given as
+        # {issue number: is_wip}, and returns the ones it no longer links to
+        with self._lock:
+            rows = self.conn.execute('SELECT target, issue FROM issue_links WHERE scope = ? AND number = ?',
+                                     (scope, number)).fetchall()
+            self.conn.execute('DELETE FROM issue_links WHERE scope = ? AND number = ?', (scope, number))
+            self.conn.executemany('INSERT INTO issue_links (scope, number, target, issue, wip) '
+                                  'VALUES (?, ?, ?, ?, ?)',
+                                  [(scope, number, target, issue, int(is_wip)) for issue, is_wip in issues.items()])
+            self.conn.commit()
+        return [issue for linked_target, issue in rows if linked_target == target and issue not in issues]
+
+    def get_issue_links(self, target: str, issue: int) -> dict:
+        # Returns {(scope, change number): is_wip} for every change linked to the issue
+        with self._lock:
+            rows = self.conn.execute('SELECT scope, number, wip FROM issue_links WHERE target = ? AND issue = ?',
+                                     (target, issue)).fetchall()
+        return {(scope, number): bool(wip) for scope, number, wip in rows}
@@ -14,8 +14,10 @@ import logging
 import os
 import sys
 
+# Only lightweight modules are imported here; the engine and its
+# dependencies (PyGithub, fabric) are imported by main() once the arguments
+# are valid, so --help and usage errors return quickly
 from gerrit_to_github_issues import errors
-from gerrit_to_github_issues.engine import update
 
 LOG_FORMAT = '%(asctime)s %(levelname)-8s %(name)s:' \
              '%(funcName)s [%(lineno)3d] %(message)s'  # noqa
@@ -27,10 +29,42 @@ def validate(namespace: argparse.Namespace):
     arg_dict = vars(namespace)
     if not ((arg_dict['github_user'] and arg_dict['github_password']) or arg_dict['github_token']):
         raise errors.GithubConfigurationError
+    if not (arg_dict['gerrit_url'] or arg_dict['config']):
+        raise errors.GerritConfigurationError
+    if arg_dict['webhook_port'] and not arg_dict['webhook_secret']:
+        raise errors.WebhookConfigurationError
     return arg_dict
 
 
-def main():
+def get_explicit_args(parser: argparse.ArgumentParser, ns: argparse.Namespace, argv: list = None) -> set:
+    # argparse only fills in defaults for attributes the namespace lacks, so
+    # parsing again into a namespace of placeholders leaves the placeholders
+    # on every option that was not given on the command line
+    unset = object()
+    given = parser.parse_args(argv, namespace=argparse.Namespace(**{dest: unset for dest in vars(ns)}))
+    return {dest for dest, value in vars(given).items() if value is not unset}
+
+
+def get_mappings(config_file: str, args: dict, explicit_args=()) -> list:
+    mapping = {
+        'gerrit_repo': args.pop('gerrit_repo_name'),
+        'github_repo': args.pop('github_repo_name'),
+        'github_project_id': args.pop('github_project_id'),
+    }
+    if not config_file:
+        return [mapping]
+    from gerrit_to_github_issues import config
+    settings = config.load_config(config_file)
+    mappings = settings.pop('mappings')
+    # Settings from the config file win over defaults and environmental
+    # variables, but not over flags given on the command line
+    args.update((key, value) for key, value in settings.items() if key not in explicit_args)
+    if not args['gerrit_url']:
+        raise errors.GerritConfigurationError
+    return mappings
+
+
+def make_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(
         prog='gerrit-to-github-issues',
         usage='synchronizes GitHub Issues with new changes found in Gerrit',
@@ -47,8 +81,34 @@ def main():
                     'to the "Submitted on Gerrit" column of the project board.',
         formatter_class=argparse.RawDescriptionHelpFormatter
     )
-    parser.add_argument('-g', '--gerrit-url', action='store', required=True, type=str,
+    parser.add_argument('-g', '--gerrit-url', action='store', required=False, type=str,
                         default=os.getenv('GERRIT_URL', default=None), help='Target Gerrit URL.')
+    parser.add_argument('--config', action='store', required=False, type=str,
+                        default=os.getenv('GERRIT_TO_GITHUB_CONFIG', default=None),
+                        help='YAML file listing many Gerrit repo, GitHub repo and project board mappings to '
+                             'sync in one run. Replaces the positional arguments. Defaults to '
+                             'GERRIT_TO_GITHUB_CONFIG in environmental variables.')
+    parser.add_argument('--serve', action='store_true', required=False, default=False,
+                        help='Runs as a long-lived daemon that follows `gerrit stream-events` and updates issues '
+                             'as changes are updated, instead of querying Gerrit once.')
+    parser.add_argument('--debounce', action='store', required=False, type=float, default=2.0,
+                        help='Seconds to wait for more events on a change before syncing it in --serve mode. '
+                             'Defaults to 2.')
+    parser.add_argument('--webhook-port', action='store', required=False, type=int, default=None,
+                        help='In --serve mode, listens on this port for GitHub issue_comment webhooks and '
+                             'handles /assign requests as they are posted.')
+    parser.add_argument('--webhook-secret', action='store', required=False, type=str,
+                        default=os.getenv('GITHUB_WEBHOOK_SECRET', default=None),
+                        help='Secret used to verify GitHub webhook signatures. Defaults to GITHUB_WEBHOOK_SECRET '
+                             'in environmental variables.')
+    parser.add_argument('--metrics-file', action='store', required=False, type=str,
+                        default=os.getenv('METRICS_FILE', default=None),
+                        help='Writes a JSON summary of the run to this file on exit: GitHub and Gerrit calls '
+                             'counted and timed by operation, phase durations, changes and issues processed and '
+                             'the remaining rate limit. Defaults to METRICS_FILE in environmental variables.')
+    parser.add_argument('--metrics-port', action='store', required=False, type=int, default=None,
+                        help='In --serve mode, serves the same metrics in the Prometheus text format on '
+                             '/metrics on this port.')
     parser.add_argument('-a', '--change-age', action='store', required=False, type=str,
                         default=None,
                         help='Specifies how far in the past to search for changes in Gerrit. '
@@ -56,6 +116,23 @@ def main():
                              'details.')
     parser.add_argument('--skip-approvals', action='store_true', required=False, default=False,
                         help='Skips evaluation of change approvals to be written to the bot comments.')
+    parser.add_argument('-c', '--checkpoint-db', action='store', required=False, type=str,
+                        default=os.getenv('CHECKPOINT_DB', default=None),
+                        help='Path to a SQLite database recording sync progress. When set, only changes updated '
+                             'since the previous run are queried and unchanged changes are skipped. Defaults to '
+                             'CHECKPOINT_DB in environmental variables.')
+    parser.add_argument('-w', '--workers', action='store', required=False, type=int, default=1,
+                        help='Number of issues to update concurrently. Changes touching the same issue are '
+                             'always applied in order. Defaults to 1.')
+    parser.add_argument('--dry-run', action='store_true', required=False, default=False,
+                        help='Prints the changes that would be made to each issue without writing to GitHub.')
+    parser.add_argument('--cache-dir', action='store', required=False, type=str,
+                        default=os.getenv('GITHUB_CACHE_DIR', default=None),
+                        help='Directory for caching GitHub responses. Cached responses are revalidated with '
+                             'conditional requests, which do not count against the rate limit. Defaults to '
+                             'GITHUB_CACHE_DIR in environmental variables.')
+    parser.add_argument('--cache-size', action='store', required=False, type=int, default=100,
+                        help='Maximum size of the GitHub response cache in MB. Defaults to 100.')
     parser.add_argument('-u', '--github-user', action='store', required=False, type=str,
                         default=os.getenv('GITHUB_USER', default=None),
                         help='Username to use for GitHub Issues integration. Defaults to GITHUB_USER in '
@@ -72,10 +149,26 @@ def main():
                         default=False, help='Enabled DEBUG level logging.')
     parser.add_argument('--log-file', action='store', required=False, type=str,
                         help='Specifies a file to output logs to. Defaults to `sys.stdout`.')
-    parser.add_argument('gerrit_repo_name', action='store', type=str, help='Target Gerrit repo.')
-    parser.add_argument('github_repo_name', action='store', type=str, help='Target Github repo.')
-    parser.add_argument('github_project_id', action='store', type=int, help='Target Github project board ID.')
+    parser.add_argument('gerrit_repo_name', action='store', nargs='?', type=str, help='Target Gerrit repo.')
+    parser.add_argument('github_repo_name', action='store', nargs='?', type=str, help='Target Github repo.')
+    parser.add_argument('github_project_id', action='store', nargs='?', type=int,
+                        help='Target Github project board ID.')
+    return parser
+
+
+def main():
+    parser = make_parser()
     ns = parser.parse_args()
+    positionals = (ns.gerrit_repo_name, ns.github_repo_name, ns.github_project_id)
+    if not ns.config and None in positionals:
+        parser.error('gerrit_repo_name, github_repo_name and github_project_id are required without --config')
+    if ns.config and any(p is not None for p in positionals):
+        parser.error('gerrit_repo_name, github_repo_name and github_project_id cannot be used with --config')
+    if ns.metrics_port and not ns.serve:
+        parser.error('--metrics-port requires --serve')
+    if ns.webhook_port and not ns.serve:
+        parser.error('--webhook-port requires --serve')
+    explicit_args = get_explicit_args(parser, ns)
     args = validate(ns)
     verbose = args.pop('verbose')
     log_file = args.pop('log_file')
@@ -91,4 +184,29 @@ def main():
     else:
         log_settings['stream'] = sys.stdout
     logging.basicConfig(**log_settings)
-    update(**args)
+    serve = args.pop('serve')
+    serve_args = {
+        'debounce': args.pop('debounce'),
+        'webhook_port': args.pop('webhook_port'),
+        'webhook_secret': args.pop('webhook_secret'),
+        'metrics_port': args.pop('metrics_port'),
+    }
+    metrics_file = args.pop('metrics_file')
+    mappings = get_mappings(args.pop('config'), args, explicit_args)
+
+    from gerrit_to_github_issues import gerrit
+    from gerrit_to_github_issues import metrics
+    if metrics_file or serve_args['metrics_port']:
+        metrics.enable()
+    try:
+        if serve:
+            from gerrit_to_github_issues import daemon
+            args.pop('change_age')
+            daemon.serve(mappings=mappings, **serve_args, **args)
+        else:
+            from gerrit_to_github_issues.engine import update_all
+            update_all(mappings=mappings, **args)
+    finally:
+        gerrit.close_connections()
+        if metrics_file:
+            metrics.write_summary(metrics_file)
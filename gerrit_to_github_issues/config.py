@@ -0,0 +1,78 @@
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import yaml
+
+from gerrit_to_github_issues import errors
+
+# Settings a config file may set for every mapping; anything not set falls
+# back to the command line
+SETTINGS = ('gerrit_url', 'gerrit_port', 'change_age', 'skip_approvals', 'checkpoint_db', 'workers',
+            'cache_dir', 'cache_size')
+# Settings that must be positive integers
+INTEGER_SETTINGS = ('gerrit_port', 'workers', 'cache_size')
+MAPPING_KEYS = ('gerrit_repo', 'github_repo', 'github_project_id')
+
+
+def load_config(path: str) -> dict:
+    """Loads a YAML file describing many repo mappings to sync in one run.
+
+    Example::
+
+        gerrit_url: review.opendev.org
+        workers: 8
+        mappings:
+          - gerrit_repo: airship/airshipctl
+            github_repo: airshipit/airshipctl
+            github_project_id: 1234
+    """
+    try:
+        with open(path) as f:
+            data = yaml.safe_load(f)
+    except (OSError, yaml.YAMLError) as e:
+        raise errors.ConfigFileError(f'Could not read {path}: {e}')
+    if not isinstance(data, dict):
+        raise errors.ConfigFileError(f'{path} must contain a mapping')
+
+    unknown = set(data) - set(SETTINGS) - {'mappings'}
+    if unknown:
+        raise errors.ConfigFileError(f'Unknown settings in {path}: {", ".join(sorted(unknown))}')
+    for key in INTEGER_SETTINGS:
+        if key not in data:
+            continue
+        try:
+            data[key] = int(data[key])
+        except (TypeError, ValueError):
+            raise errors.ConfigFileError(f'{key} in {path} must be an integer, got {data[key]!r}')
+        if data[key] < 1:
+            raise errors.ConfigFileError(f'{key} in {path} must be positive, got {data[key]}')
+    mappings = data.get('mappings')
+    if not mappings or not isinstance(mappings, list):
+        raise errors.ConfigFileError(f'{path} must define a list of mappings')
+
+    seen, boards = set(), {}
+    for mapping in mappings:
+        if not isinstance(mapping, dict) or set(mapping) != set(MAPPING_KEYS):
+            raise errors.ConfigFileError(f'Each mapping must define exactly {", ".join(MAPPING_KEYS)}')
+        if mapping['gerrit_repo'] in seen:
+            raise errors.ConfigFileError(f'Gerrit repo {mapping["gerrit_repo"]} is mapped more than once')
+        seen.add(mapping['gerrit_repo'])
+        try:
+            mapping['github_project_id'] = int(mapping['github_project_id'])
+        except (TypeError, ValueError):
+            raise errors.ConfigFileError(f'github_project_id of {mapping["gerrit_repo"]} must be an integer, '
+                                         f'got {mapping["github_project_id"]!r}')
+        # Gerrit repos may share a GitHub repo, but its issues live on one board
+        board = boards.setdefault(mapping['github_repo'], mapping['github_project_id'])
+        if board != mapping['github_project_id']:
+            raise errors.ConfigFileError(f'GitHub repo {mapping["github_repo"]} is mapped to more than one '
+                                         f'project board')
+    return data
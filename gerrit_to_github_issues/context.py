@@ -0,0 +1,41 @@
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import logging
+
+import github
+from github.Project import Project
+from github.Repository import Repository
+
+from gerrit_to_github_issues import github_issues
+
+LOG = logging.getLogger(__name__)
+
+
+class RunContext:
+    """Values that stay the same for a whole sync run.
+
+    Built once per run so the engine and its workers never ask GitHub again
+    for the bot login, the board's columns and cards or the repo's labels.
+    """
+
+    def __init__(self, gh: github.Github, repo: Repository, project_board: Project,
+                 skip_approvals: bool = False, dry_run: bool = False,
+                 board_index: github_issues.BoardIndex = None):
+        self.gh = gh
+        self.repo = repo
+        self.skip_approvals = skip_approvals
+        self.dry_run = dry_run
+        self.bot_login = gh.get_user().login
+        self.labels = {str(l.name) for l in repo.get_labels()}
+        self.board_index = board_index or github_issues.BoardIndex(project_board)
+        self.snapshots = {}
+        LOG.debug(f'Run context ready for {repo.full_name} as {self.bot_login}')
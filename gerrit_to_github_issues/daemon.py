@@ -0,0 +1,251 @@
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import logging
+import threading
+import time
+from concurrent.futures import wait
+
+from gerrit_to_github_issues import checkpoint
+from gerrit_to_github_issues import engine
+from gerrit_to_github_issues import gerrit
+from gerrit_to_github_issues import metrics
+from gerrit_to_github_issues import scheduler
+from gerrit_to_github_issues import webhook
+
+LOG = logging.getLogger(__name__)
+
+EVENT_TYPES = {
+    'change-abandoned',
+    'change-merged',
+    'change-restored',
+    'comment-added',
+    'patchset-created',
+    'vote-deleted',
+    'wip-state-changed',
+}
+RECONNECT_DELAY = 5
+MAX_RECONNECT_DELAY = 300
+
+
+class Daemon:
+    """Keeps GitHub in sync with Gerrit by following ``gerrit stream-events``.
+
+    A listener thread reads events from one SSH channel and queues the
+    affected change numbers. Events for a change within ``debounce`` seconds
+    are coalesced, then the dispatcher re-queries the change and hands it to
+    the engine. After a disconnect the listener reconnects and backfills
+    every change updated since the last event it saw. With ``webhook_port``
+    set, GitHub /assign comments are also handled as they are posted, and
+    with ``metrics_port`` set, run metrics are served to Prometheus.
+    """
+
+    def __init__(self, gerrit_url: str, gh, mappings: list, gerrit_port: int = 29418,
+                 skip_approvals: bool = False, checkpoint_db: str = None, workers: int = 1,
+                 dry_run: bool = False, debounce: float = 2.0, refresh_interval: int = 3600,
+                 webhook_port: int = None, webhook_secret: str = None, metrics_port: int = None):
+        self.gerrit_url = gerrit_url
+        self.gerrit_port = gerrit_port
+        self.gh = gh
+        self.mappings = mappings
+        self.skip_approvals = skip_approvals
+        self.dry_run = dry_run
+        self.workers = workers
+        self.debounce = debounce
+        self.refresh_interval = refresh_interval
+        self.contexts = engine.build_contexts(gh, mappings, skip_approvals, dry_run, workers)
+        self.contexts_built = time.time()
+        self.scheduler = scheduler.KeyedScheduler(workers)
+        self.store = checkpoint.CheckpointStore(checkpoint_db) if checkpoint_db and not dry_run else None
+        self.scope = f'{gerrit_url}#stream-events'
+        # With a checkpoint store the daemon shares the batch sync's record of
+        # which changes link to each issue
+        self.issue_links = engine.IssueLinks(self.store)
+        if not self.store:
+            LOG.warning('No checkpoint database, issues are only planned against the changes seen since start')
+        self.last_event = self.store.get_cursor(self.scope) if self.store else None
+        # Set once a change fails to sync; the stored cursor then stays put so
+        # a restart's backfill picks the change up again
+        self.cursor_blocked = False
+        self._pending = {}
+        self._cond = threading.Condition()
+        self._stopped = threading.Event()
+        self.webhook = None
+        if webhook_port:
+            self.webhook = webhook.WebhookServer(gh, [m['github_repo'] for m in mappings], webhook_secret,
+                                                 webhook_port, dry_run=dry_run)
+        self.metrics_server = None
+        if metrics_port:
+            metrics.enable()
+            self.metrics_server = metrics.MetricsServer(metrics_port)
+
+    def serve(self):
+        listener = threading.Thread(target=self.listen, name='gerrit-stream-events', daemon=True)
+        listener.start()
+        if self.webhook:
+            self.webhook.start()
+        if self.metrics_server:
+            self.metrics_server.start()
+        try:
+            self.dispatch()
+        finally:
+            self.stop()
+            if self.webhook:
+                self.webhook.stop()
+            if self.metrics_server:
+                self.metrics_server.stop()
+            self.scheduler.shutdown()
+            if self.store:
+                self.store.close()
+
+    def stop(self):
+        self._stopped.set()
+        with self._cond:
+            self._cond.notify_all()
+
+    def listen(self):
+        delay = RECONNECT_DELAY
+        while not self._stopped.is_set():
+            if self.last_event:
+                # Backfill alongside the new subscription so nothing that
+                # happened while disconnected is missed
+                threading.Thread(target=self.backfill, args=(self.last_event,), name='gerrit-backfill',
+                                 daemon=True).start()
+            try:
+                LOG.info(f'Subscribing to stream-events on {self.gerrit_url}')
+                for event in gerrit.stream_events(self.gerrit_url, self.gerrit_port):
+                    delay = RECONNECT_DELAY
+                    self.handle_event(event)
+                    if self._stopped.is_set():
+                        return
+                LOG.warning(f'stream-events on {self.gerrit_url} closed')
+            except Exception:
+                LOG.exception(f'stream-events on {self.gerrit_url} failed')
+            self._stopped.wait(delay)
+            delay = min(delay * 2, MAX_RECONNECT_DELAY)
+
+    @metrics.traced
+    def backfill(self, since: int):
+        try:
+            for change in gerrit.get_changes(self.gerrit_url, list(self.contexts), port=self.gerrit_port,
+                                             after=since - 1):
+                self.enqueue(change.number, change.project, change.last_updated)
+        except Exception:
+            LOG.exception(f'Backfill from {since} failed')
+
+    def handle_event(self, event: dict):
+        if event.get('type') not in EVENT_TYPES:
+            return
+        change = event.get('change') or {}
+        if change.get('project') in self.contexts:
+            self.enqueue(int(change['number']), change['project'], event.get('eventCreatedOn'))
+        if event.get('eventCreatedOn'):
+            self.last_event = max(self.last_event or 0, event['eventCreatedOn'])
+
+    def enqueue(self, change_number: int, project: str, event_time: int = None):
+        # Keeps the time of the first event seen for a pending change
+        with self._cond:
+            if change_number not in self._pending:
+                self._pending[change_number] = (project, time.time() + self.debounce, event_time)
+                self._cond.notify()
+
+    def dispatch(self):
+        while not self._stopped.is_set():
+            with self._cond:
+                now = time.time()
+                due = [n for n, (_, at, _) in self._pending.items() if at <= now]
+                if not due:
+                    timeout = min(at for _, at, _ in self._pending.values()) - now if self._pending else None
+                    self._cond.wait(timeout)
+                    continue
+                batch = [(n, self._pending.pop(n)[0]) for n in due]
+                # Every event up to last_event is either in this batch or
+                # still pending, since events are queued before it moves
+                covered = self.last_event
+                waiting = [t for _, _, t in self._pending.values() if t]
+            self.refresh_contexts()
+            results = [self.sync_change(change_number, project) for change_number, project in batch]
+            self.advance_cursor(results, covered, waiting)
+
+    def advance_cursor(self, results: list, covered: int, waiting: list):
+        # Only move the cursor past a batch once all of its issue updates
+        # succeeded, and never past a change that is still waiting
+        if not self.store or not covered:
+            return
+        futures = [f for r in results if r for f in r]
+        wait(futures)
+        if any(r is None for r in results) or any(f.exception() for f in futures):
+            if not self.cursor_blocked:
+                LOG.warning('A change failed to sync, holding the stream-events checkpoint until restart')
+            self.cursor_blocked = True
+        if self.cursor_blocked:
+            return
+        cursor = min([covered] + [t - 1 for t in waiting])
+        self.store.set_cursor(self.scope, cursor)
+
+    def refresh_contexts(self):
+        # Cards get added to boards while the daemon runs, so re-list them now
+        # and then rather than trusting a stale index forever
+        if time.time() - self.contexts_built < self.refresh_interval:
+            return
+        LOG.info('Refreshing project boards and labels')
+        self.contexts = engine.build_contexts(self.gh, self.mappings, self.skip_approvals, self.dry_run,
+                                              self.workers)
+        self.contexts_built = time.time()
+
+    @metrics.traced
+    def sync_change(self, change_number: int, project: str) -> list:
+        # Returns the futures of the change's issue updates, or None if the
+        # change could not be queried
+        try:
+            change = gerrit.get_change(self.gerrit_url, change_number, self.gerrit_port)
+        except Exception:
+            LOG.exception(f'Failed to query change #{change_number}')
+            return None
+        if not change or not change.commit_message:
+            return []
+
+        scope, fingerprint = f'{self.gerrit_url}/{project}', None
+        if self.store:
+            fingerprint = checkpoint.change_fingerprint(change, self.skip_approvals)
+            if self.store.is_unchanged(scope, change.number, fingerprint):
+                LOG.debug(f'Change #{change_number} is unchanged, skipping')
+                metrics.incr('changes_skipped')
+                return []
+        LOG.info(f'Syncing change #{change_number} of {project}')
+        futures = engine.process_change(self.contexts[project], change, scope, self.issue_links, self.scheduler)
+        if not self.store:
+            return futures
+
+        remaining = [len(futures)]
+        lock = threading.Lock()
+
+        def issue_done(future):
+            # Record the change once all of its issues were updated
+            with lock:
+                remaining[0] -= 1
+                if remaining[0] or any(f.exception() for f in futures):
+                    return
+            self.store.record_change(scope, change.number, change.patch_set, fingerprint)
+
+        for future in futures:
+            future.add_done_callback(issue_done)
+        return futures
+
+
+def serve(gerrit_url: str, mappings: list, github_user: str, github_password: str, github_token: str,
+          gerrit_port: int = 29418, skip_approvals: bool = False, checkpoint_db: str = None, workers: int = 1,
+          dry_run: bool = False, cache_dir: str = None, cache_size: int = 100, debounce: float = 2.0,
+          webhook_port: int = None, webhook_secret: str = None, metrics_port: int = None):
+    gh = engine.make_client(github_user, github_password, github_token, cache_dir, cache_size)
+    Daemon(gerrit_url, gh, mappings, gerrit_port=gerrit_port, skip_approvals=skip_approvals,
+           checkpoint_db=checkpoint_db, workers=workers, dry_run=dry_run, debounce=debounce,
+           webhook_port=webhook_port, webhook_secret=webhook_secret, metrics_port=metrics_port).serve()
@@ -11,101 +11,415 @@
 # limitations under the License.
 import datetime
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from zoneinfo import ZoneInfo
 
 import github
-import pytz as pytz
-from github.Repository import Repository
-from github.Project import Project
 from github.Issue import Issue
+from github.Project import Project
 
+from gerrit_to_github_issues import checkpoint
+from gerrit_to_github_issues import context
 from gerrit_to_github_issues import gerrit
+from gerrit_to_github_issues import github_http
 from gerrit_to_github_issues import github_issues
+from gerrit_to_github_issues import metrics
+from gerrit_to_github_issues import planner
+from gerrit_to_github_issues import prefetch
+from gerrit_to_github_issues import ratelimit
+from gerrit_to_github_issues import scheduler
 
 LOG = logging.getLogger(__name__)
 
+PREFETCH_BATCH_SIZE = 100
+COMMENT_TIMEZONE = ZoneInfo('America/Chicago')
+
 
 def update(gerrit_url: str, gerrit_repo_name: str, github_project_id: int,
            github_repo_name: str, github_user: str, github_password: str, github_token: str,
-           change_age: str = None, skip_approvals: bool = False):
-    gh = github_issues.get_client(github_user, github_password, github_token)
-    repo = gh.get_repo(github_repo_name)
-    project_board = gh.get_project(github_project_id)
-    change_list = gerrit.get_changes(gerrit_url, gerrit_repo_name, change_age=change_age)
-    for change in change_list['data']:
-        if 'commitMessage' in change:
-            process_change(gh, change, repo, project_board, skip_approvals)
-
-    # Handle the incoming issue assignment requests
-    github_issues.assign_issues(repo)
-
-
-def process_change(gh: github.Github, change: dict, repo: Repository,
-                   project_board: Project, skip_approvals: bool = False):
-    issue_numbers_dict = github_issues.parse_issue_number(change['commitMessage'])
-    issue_numbers_dict = github_issues.remove_duplicated_issue_numbers(issue_numbers_dict)
+           change_age: str = None, skip_approvals: bool = False, checkpoint_db: str = None,
+           workers: int = 1, dry_run: bool = False, cache_dir: str = None, cache_size: int = 100):
+    mappings = [{
+        'gerrit_repo': gerrit_repo_name,
+        'github_repo': github_repo_name,
+        'github_project_id': github_project_id,
+    }]
+    update_all(gerrit_url, mappings, github_user, github_password, github_token, change_age=change_age,
+               skip_approvals=skip_approvals, checkpoint_db=checkpoint_db, workers=workers, dry_run=dry_run,
+               cache_dir=cache_dir, cache_size=cache_size)
+
+
+def update_all(gerrit_url: str, mappings: list, github_user: str, github_password: str, github_token: str,
+               gerrit_port: int = 29418, change_age: str = None, skip_approvals: bool = False,
+               checkpoint_db: str = None, workers: int = 1, dry_run: bool = False, cache_dir: str = None,
+               cache_size: int = 100):
+    gh = make_client(github_user, github_password, github_token, cache_dir, cache_size)
+    sync(gh, gerrit_url, mappings, gerrit_port=gerrit_port, change_age=change_age, skip_approvals=skip_approvals,
+         checkpoint_db=checkpoint_db, workers=workers, dry_run=dry_run)
+
+
+def sync(gh: github.Github, gerrit_url: str, mappings: list, gerrit_port: int = 29418, change_age: str = None,
+         skip_approvals: bool = False, checkpoint_db: str = None, workers: int = 1, dry_run: bool = False):
+    with metrics.phase('build_contexts'):
+        contexts = build_contexts(gh, mappings, skip_approvals, dry_run, workers)
+    issue_scheduler = scheduler.KeyedScheduler(workers)
+
+    store, cursors = None, {}
+    if checkpoint_db and not dry_run:
+        store = checkpoint.CheckpointStore(checkpoint_db)
+        cursors = {name: store.get_cursor(f'{gerrit_url}/{name}') for name in contexts}
+        LOG.info(f'Resuming from checkpoints {cursors}')
+
+    # A single query covers every project, so it resumes from the oldest
+    # checkpoint, one second behind so changes sharing its timestamp are not
+    # lost; the fingerprints below make the overlap free.
+    after = None
+    if cursors and all(cursors.values()):
+        after = min(cursors.values()) - 1
+    pending = []
+    targets = {ctx.repo.full_name: ctx for ctx in contexts.values()}
+    issue_links = IssueLinks(store)
+    # The issues the run touched, each with the futures lists of the changes
+    # that link to it. Their labels and columns are planned once the query
+    # is done, when every change linked to them is known.
+    touched = {}
+
+    def flush(ctx: context.RunContext, batch: list):
+        # Fetch every issue the batch refers to in a few GraphQL queries,
+        # then hand each issue its changes' comments while the rest of the
+        # changes are still being read
+        target = ctx.repo.full_name
+        changes_by_issue = {}
+        for change, scope, fingerprint in batch:
+            futures = []
+            pending.append((scope, change.number, change.patch_set, fingerprint, change.last_updated, futures))
+            if not change.commit_message:
+                continue
+            change_links = get_issue_links(change)
+            if change_links:
+                metrics.incr('changes_processed')
+            for issue_number in issue_links.update(target, scope, change.number, change_links):
+                touched.setdefault((target, issue_number), [])
+            # Only the fields used in the bot comment are kept past this point
+            linked_change = change._replace(commit_message=None)
+            for issue_number, key, _ in change_links:
+                changes_by_issue.setdefault(issue_number, []).append((linked_change, key, futures))
+                touched.setdefault((target, issue_number), []).append(futures)
+        with metrics.phase('prefetch'):
+            ctx.snapshots.update(prefetch.prefetch_issues(ctx.repo, changes_by_issue.keys() - ctx.snapshots.keys(),
+                                                          ctx.bot_login))
+        for issue_number, links in changes_by_issue.items():
+            future = issue_scheduler.submit((target, issue_number), process_issue, ctx, issue_number,
+                                            [(change, key) for change, key, _ in links])
+            for _, _, futures in links:
+                futures.append(future)
+        batch.clear()
+
+    # Changes are batched per GitHub repo, which may serve several Gerrit repos
+    batches = {name: [] for name in targets}
+    try:
+        with metrics.phase('sync_changes'):
+            for change in gerrit.get_changes(gerrit_url, list(contexts), port=gerrit_port, change_age=change_age,
+                                             after=after):
+                metrics.incr('changes_queried')
+                ctx = contexts.get(change.project)
+                if not ctx:
+                    LOG.debug(f'Change #{change.number} belongs to unmapped project {change.project}')
+                    continue
+                scope, fingerprint = f'{gerrit_url}/{change.project}', None
+                if store:
+                    fingerprint = checkpoint.change_fingerprint(change, skip_approvals)
+                    if store.is_unchanged(scope, change.number, fingerprint):
+                        LOG.debug(f'Change #{change.number} is unchanged since the last run, skipping')
+                        metrics.incr('changes_skipped')
+                        continue
+                batch = batches[ctx.repo.full_name]
+                batch.append((change, scope, fingerprint))
+                if len(batch) >= PREFETCH_BATCH_SIZE:
+                    flush(ctx, batch)
+            for name, batch in batches.items():
+                flush(targets[name], batch)
+
+            for (target, issue_number), linked_futures in touched.items():
+                future = issue_scheduler.submit((target, issue_number), process_issue, targets[target],
+                                                issue_number, [], issue_links.is_wip(target, issue_number))
+                for futures in linked_futures:
+                    futures.append(future)
+            issue_scheduler.shutdown()
+    except BaseException:
+        if store:
+            record_progress(store, gerrit_url, cursors, pending)
+            store.close()
+        raise
+
+    try:
+        if store:
+            record_progress(store, gerrit_url, cursors, pending)
+
+        if dry_run:
+            LOG.info('Dry run, skipping issue assignment requests')
+            return
+
+        # Handle the incoming issue assignment requests
+        with metrics.phase('assign_issues'), ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            list(pool.map(lambda ctx: github_issues.assign_issues(ctx.repo, store), contexts.values()))
+    finally:
+        if store:
+            store.close()
+
+
+def make_client(github_user: str, github_password: str, github_token: str, cache_dir: str = None,
+                cache_size: int = 100) -> github.Github:
+    cache = github_http.ResponseCache(cache_dir, cache_size * 1024 * 1024) if cache_dir else None
+    return github_issues.get_client(github_user, github_password, github_token,
+                                    rate_limiter=ratelimit.RateLimiter(), cache=cache)
+
+
+def build_contexts(gh: github.Github, mappings: list, skip_approvals: bool = False, dry_run: bool = False,
+                   workers: int = 1) -> dict:
+    """Returns the RunContext of each Gerrit repo.
+
+    Gerrit repos that sync to the same GitHub repo share one context, so each
+    issue has a single snapshot and card, and every board is listed once
+    however many repos it holds. Boards and contexts are built in parallel
+    since each board listing pages through every column.
+    """
+    project_ids = list(dict.fromkeys(m['github_project_id'] for m in mappings))
+    targets = {}
+    for mapping in mappings:
+        targets.setdefault(mapping['github_repo'], mapping['github_project_id'])
+
+    def make_board(project_id: int) -> (Project, github_issues.BoardIndex):
+        with metrics.operation('build_contexts'):
+            project_board = gh.get_project(project_id)
+            return project_board, github_issues.BoardIndex(project_board)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        boards = dict(zip(project_ids, pool.map(make_board, project_ids)))
+
+        def make_context(github_repo: str) -> context.RunContext:
+            with metrics.operation('build_contexts'):
+                project_board, board_index = boards[targets[github_repo]]
+                return context.RunContext(gh, gh.get_repo(github_repo), project_board, skip_approvals, dry_run,
+                                          board_index)
+
+        contexts = dict(zip(targets, pool.map(make_context, list(targets))))
+    return {m['gerrit_repo']: contexts[m['github_repo']] for m in mappings}
+
+
+def record_progress(store: checkpoint.CheckpointStore, gerrit_url: str, cursors: dict, pending: list):
+    # Only record changes whose issues were all updated, and only move a
+    # project's cursor forward when none of its changes failed
+    failed = set()
+    newest = {f'{gerrit_url}/{name}': cursor for name, cursor in cursors.items()}
+    for scope, number, patch_set, fingerprint, change_updated, futures in pending:
+        if any(not f.done() or f.exception() for f in futures):
+            failed.add(scope)
+            continue
+        store.record_change(scope, number, patch_set, fingerprint)
+        newest[scope] = max(newest.get(scope) or 0, change_updated)
+    for scope, last_updated in newest.items():
+        if last_updated and scope not in failed:
+            store.set_cursor(scope, last_updated)
+
+
+def get_issue_links(change: gerrit.Change) -> list:
+    # Returns an (issue number, key, is_wip) tuple per issue the change refers to
+    tags = github_issues.parse_commit_message(change.commit_message)
+    issue_numbers_dict = github_issues.remove_duplicated_issue_numbers(tags.issue_numbers())
     if not issue_numbers_dict:
-        LOG.warning(f'No issue tag found for change #{change["number"]}')
+        LOG.warning(f'No issue tag found for change #{change.number}')
+    return [(issue_number, key, tags.wip) for key, issues_list in issue_numbers_dict.items()
+            for issue_number in issues_list]
+
+
+class IssueLinks:
+    """Tracks which changes link to each issue, and whether each is WIP.
+
+    An issue's labels and column follow every change linked to it, while
+    the changes themselves are processed a batch at a time, so only their
+    numbers and WIP flags are kept here. Issues are keyed by GitHub repo and
+    changes by Gerrit scope, and the links may be updated and read from
+    different threads. With a checkpoint store the links live in the store,
+    so an issue is still planned against the unchanged changes that an
+    incremental run or the daemon never reads.
+    """
+
+    def __init__(self, store: checkpoint.CheckpointStore = None):
+        self.store = store
+        self._lock = threading.Lock()
+        self._issues = {}
+        self._changes = {}
+
+    def update(self, target: str, scope: str, change_number: int, change_links: list) -> list:
+        # Replaces the issues a change links to and returns the numbers of
+        # the ones it no longer links to, whose state may now differ
+        if self.store:
+            return self.store.set_issue_links(scope, change_number, target,
+                                              {issue_number: is_wip for issue_number, _, is_wip in change_links})
+        change = (scope, change_number)
+        linked = {(target, issue_number): is_wip for issue_number, _, is_wip in change_links}
+        with self._lock:
+            dropped = self._changes.pop(change, set()) - linked.keys()
+            for issue in dropped:
+                self._issues[issue].pop(change, None)
+            for issue, is_wip in linked.items():
+                self._issues.setdefault(issue, {})[change] = is_wip
+            if linked:
+                self._changes[change] = set(linked)
+        return [issue_number for _, issue_number in dropped]
+
+    def is_wip(self, target: str, issue_number: int) -> bool:
+        if self.store:
+            flags = list(self.store.get_issue_links(target, issue_number).values())
+            return bool(flags) and all(flags)
+        with self._lock:
+            flags = list(self._issues.get((target, issue_number), {}).values())
+        return bool(flags) and all(flags)
+
+
+def process_change(ctx: context.RunContext, change: gerrit.Change, scope: str, issue_links: IssueLinks,
+                   issue_scheduler: scheduler.KeyedScheduler = None) -> list:
+    """Brings every issue a change refers to, or no longer refers to, in line with it.
+
+    Used for changes that arrive one at a time. Each issue's labels and
+    column are planned against all of its linked changes, as recorded in
+    ``issue_links``, just as a batch sync plans them.
+    """
+    change_links = get_issue_links(change)
+    if change_links:
+        metrics.incr('changes_processed')
+    target = ctx.repo.full_name
+    dropped = issue_links.update(target, scope, change.number, change_links)
+    work = [(issue_number, [(change, key)]) for issue_number, key, _ in change_links]
+    work.extend((issue_number, []) for issue_number in dropped)
+    futures = []
+    for issue_number, links in work:
+        args = (ctx, issue_number, links, issue_links.is_wip(target, issue_number))
+        # Work is keyed by issue so two changes never race on the same issue
+        if issue_scheduler:
+            futures.append(issue_scheduler.submit((target, issue_number), process_issue, *args))
+        else:
+            process_issue(*args)
+    return futures
+
+
+@metrics.traced
+def process_issue(ctx: context.RunContext, issue_number: int, links: list, is_wip: bool = None):
+    """Brings one issue in line with the changes linked to it.
+
+    ``links`` holds a ``(change, key)`` pair per change whose bot comment
+    should be posted or refreshed. ``is_wip`` is the combined state of every
+    change linked to the issue and decides its labels and column: the issue
+    is only marked WIP while every linked change is. With ``is_wip`` None
+    the labels and column are left to a later call that knows all of them.
+    """
+    if is_wip is not None:
+        metrics.incr('issues_processed')
+    repo = ctx.repo
+    change_numbers = [change.number for change, _ in links]
+    snapshot = ctx.snapshots.get(issue_number)
+    if snapshot:
+        issue = prefetch.make_issue(repo, issue_number)
+        bot_comments = {}
+        for number in change_numbers:
+            comment_id, comment_body = snapshot.find_bot_comment(number)
+            if comment_id:
+                bot_comments[number] = prefetch.make_issue_comment(repo, comment_id, comment_body)
+        missing = [n for n in change_numbers if n not in bot_comments]
+        if missing and not snapshot.complete:
+            bot_comments.update(github_issues.get_bot_comments(issue, ctx.bot_login, missing))
+        state, labels = snapshot.state, set(snapshot.labels)
+    else:
+        try:
+            issue = repo.get_issue(issue_number)
+        except github.GithubException:
+            LOG.warning(f'Issue #{issue_number} not found for project')
+            return
+        bot_comments = github_issues.get_bot_comments(issue, ctx.bot_login, change_numbers) if links else {}
+        state, labels = issue.state, {str(l.name) for l in issue.get_labels()}
+
+    comments = []
+    for change, key in links:
+        bot_comment = bot_comments.get(change.number)
+        comments.append((bot_comment.id if bot_comment else None, bot_comment.body if bot_comment else None,
+                         get_issue_comment(change, key, ctx.skip_approvals), key))
+    _, column = ctx.board_index.get_card(github_issues.issue_url(repo, issue_number))
+    plan = planner.plan_issue(issue_number, state, labels, column.name if column else None,
+                              ctx.board_index.columns, is_wip, comments)
+    changes_str = ', '.join(f'#{n}' for n in change_numbers)
+    if ctx.dry_run:
+        print(f'[dry-run] change {changes_str} -> {plan.describe()}' if links else f'[dry-run] {plan.describe()}')
         return
-    for key, issues_list in issue_numbers_dict.items():
-        for issue_number in issues_list:
-            try:
-                issue = repo.get_issue(issue_number)
-            except github.GithubException:
-                LOG.warning(f'Issue #{issue_number} not found for project')
-                return
-            bot_comment = github_issues.get_bot_comment(issue, gh.get_user().login, change['number'])
-            if issue.state == 'closed' and not bot_comment:
-                LOG.debug(f'Issue #{issue_number} was closed, reopening...')
-
-                # NOTE(howell): Reopening a closed issue will move it from the
-                # "Done" column to the "In Progress" column on the project
-                # board via Github automation.
-                issue.edit(state='open')
-                issue.create_comment('Issue reopened due to new activity on Gerrit.\n\n')
-
-            labels = [str(l.name) for l in list(issue.get_labels())]
-            if 'WIP' in change['commitMessage'] or 'DNM' in change['commitMessage']:
-                if 'wip' not in labels:
-                    LOG.debug(f'add `wip` to #{issue_number}')
-                    issue.add_to_labels('wip')
-                if 'ready for review' in labels:
-                    try:
-                        LOG.debug(f'rm `ready for review` to #{issue_number}')
-                        issue.remove_from_labels('ready for review')
-                    except github.GithubException:
-                        LOG.debug(f'`ready for review` tag does not exist on issue #{issue_number}')
-                move_issue(project_board, issue, 'In Progress')
-            else:
-                if 'ready for review' not in labels:
-                    LOG.debug(f'add `ready for review` to #{issue_number}')
-                    issue.add_to_labels('ready for review')
-                if 'wip' in labels:
-                    try:
-                        LOG.debug(f'rm `wip` to #{issue_number}')
-                        issue.remove_from_labels('wip')
-                    except github.GithubException:
-                        LOG.debug(f'`wip` tag does not exist on issue #{issue_number}')
-                move_issue(project_board, issue, 'Submitted on Gerrit')
-            comment_msg = get_issue_comment(change, key, skip_approvals)
-            if not bot_comment:
-                if key == 'closes':
-                    comment_msg += '\n\nThis change will close this issue when merged.'
-                LOG.debug(f'Comment to post on #{issue_number}: {comment_msg}')
-                issue.create_comment(comment_msg)
-                LOG.info(f'Comment posted to issue #{issue_number}')
-            else:
-                LOG.debug(f'Comment to edit on #{issue_number}: {comment_msg}')
-                comment = github_issues.get_bot_comment(issue, gh.get_user().login, change['number'])
-                comment.edit(comment_msg)
-                LOG.info(f'Comment edited to issue #{issue_number}')
-
-
-def get_issue_comment(change: dict, key: str, skip_approvals: bool = False) -> str:
-    comment_str = f'## Related Change [#{change["number"]}]({change["url"]})\n\n' \
-                  f'**Subject:** {change["subject"]}\n' \
-                  f'**Link:** {change["url"]}\n' \
-                  f'**Status:** {change["status"]}\n' \
-                  f'**Owner:** {change["owner"]["name"]} ({change["owner"]["email"]})\n\n'
+    if plan.is_noop():
+        LOG.debug(f'Issue #{issue_number} is up to date' + (f' with change {changes_str}' if links else ''))
+        if is_wip is not None:
+            metrics.incr('issues_unchanged')
+        return
+    apply_plan(ctx, plan, issue, list(bot_comments.values()), snapshot)
+    metrics.incr('issues_updated')
+
+
+@metrics.traced
+def apply_plan(ctx: context.RunContext, plan: planner.IssuePlan, issue: Issue, bot_comments: list,
+               snapshot: prefetch.IssueSnapshot = None):
+    issue_number = plan.issue_number
+    if plan.reopen:
+        LOG.debug(f'Issue #{issue_number} was closed, reopening...')
+
+        # NOTE(howell): Reopening a closed issue will move it from the
+        # "Done" column to the "In Progress" column on the project
+        # board via Github automation.
+        issue.edit(state='open')
+        issue.create_comment(planner.REOPEN_COMMENT)
+        if snapshot:
+            snapshot.state = 'open'
+
+    for label in plan.add_labels:
+        if label not in ctx.labels:
+            LOG.warning(f'Label `{label}` does not exist in {ctx.repo.full_name}, GitHub will create it')
+            ctx.labels.add(label)
+        LOG.debug(f'add `{label}` to #{issue_number}')
+        issue.add_to_labels(label)
+        if snapshot:
+            snapshot.labels.add(label)
+    for label in plan.remove_labels:
+        if label not in ctx.labels:
+            LOG.debug(f'`{label}` tag does not exist on issue #{issue_number}')
+            continue
+        try:
+            LOG.debug(f'rm `{label}` to #{issue_number}')
+            issue.remove_from_labels(label)
+        except github.GithubException:
+            LOG.debug(f'`{label}` tag does not exist on issue #{issue_number}')
+        if snapshot:
+            snapshot.labels.discard(label)
+
+    if plan.column:
+        move_issue(ctx.board_index, issue, plan.column)
+
+    comments_by_id = {c.id: c for c in bot_comments}
+    for comment_id, comment_body in plan.comments:
+        if comment_id:
+            LOG.debug(f'Comment to edit on #{issue_number}: {comment_body}')
+            comment = comments_by_id[comment_id]
+            comment.edit(comment_body)
+            LOG.info(f'Comment edited to issue #{issue_number}')
+        else:
+            LOG.debug(f'Comment to post on #{issue_number}: {comment_body}')
+            comment = issue.create_comment(comment_body)
+            LOG.info(f'Comment posted to issue #{issue_number}')
+        if snapshot:
+            snapshot.bot_comments[comment.id] = comment_body
+
+
+def get_issue_comment(change: gerrit.Change, key: str, skip_approvals: bool = False) -> str:
+    comment_str = f'## Related Change [#{change.number}]({change.url})\n\n' \
+                  f'**Subject:** {change.subject}\n' \
+                  f'**Link:** {change.url}\n' \
+                  f'**Status:** {change.status}\n' \
+                  f'**Owner:** {change.owner_name} ({change.owner_email})\n\n'
     if key == 'closes':
         comment_str += 'This change will close this issue when merged.\n\n'
     if not skip_approvals:
@@ -117,12 +431,11 @@ def get_issue_comment(change: dict, key: str, skip_approvals: bool = False) -> s
             'Verified': [],
             'Workflow': []
         }
-        if 'approvals' in change['currentPatchSet']:
-            for approval in change['currentPatchSet']['approvals']:
-                if approval['type'] in approval_dict:
-                    approval_dict[approval['type']].append((approval['by']['name'], approval['value']))
-                else:
-                    LOG.warning(f'Approval type "{approval["type"]}" is not a known approval type')
+        for approval in change.approvals:
+            if approval.type in approval_dict:
+                approval_dict[approval.type].append((approval.by, approval.value))
+            else:
+                LOG.warning(f'Approval type "{approval.type}" is not a known approval type')
 
         for key in ['Code-Review', 'Verified', 'Workflow']:
             comment_str += f'{key}\n'
@@ -134,30 +447,30 @@ def get_issue_comment(change: dict, key: str, skip_approvals: bool = False) -> s
             else:
                 comment_str += '! None\n'
         comment_str += '```'
-    dt = datetime.datetime.now(pytz.timezone('America/Chicago')).strftime('%Y-%m-%d %H:%M:%S %Z').strip()
+    dt = datetime.datetime.now(COMMENT_TIMEZONE).strftime('%Y-%m-%d %H:%M:%S %Z').strip()
     comment_str += f'\n\n*Last Updated: {dt}*'
     return comment_str
 
 
-def move_issue(project_board: Project, issue: Issue, to_col_name: str):
-    to_col, card = None, None
-    for col in project_board.get_columns():
-        if col.name == to_col_name:
-            to_col = col
-        else:
-            for c in col.get_cards():
-                if c.get_content() == issue:
-                    card = c
-
+@metrics.traced
+def move_issue(board_index: github_issues.BoardIndex, issue: Issue, to_col_name: str):
+    project_name = board_index.project_board.name
+    to_col = board_index.get_column(to_col_name)
     if not to_col:
-        LOG.warning(f'Column with name "{to_col_name}" could not be found for project "{project_board.name}"')
+        LOG.warning(f'Column with name "{to_col_name}" could not be found for project "{project_name}"')
         return
 
+    card, from_col = board_index.get_card(issue.url)
     if not card:
-        LOG.warning(f'Issue with name "{issue.name}" could not be found for project "{project_board.name}"')
+        LOG.warning(f'Issue #{issue.number} could not be found for project "{project_name}"')
+        return
+
+    if from_col.id == to_col.id:
+        LOG.debug(f'Issue #{issue.number} is already in column "{to_col_name}"')
         return
 
     if card.move("top", to_col):
-        LOG.info(f'Moved issue "{issue.name}" to column "{to_col_name}"')
+        board_index.card_moved(issue.url, card, to_col)
+        LOG.info(f'Moved issue #{issue.number} to column "{to_col_name}"')
     else:
-        LOG.warning(f'Failed to move issue "{issue.name}" to column "{to_col_name}"')
+        LOG.warning(f'Failed to move issue #{issue.number} to column "{to_col_name}"')
@@ -17,3 +17,15 @@ class GithubConfigurationError(Exception):
 
 class GerritConfigurationError(Exception):
     message = 'No Gerrit URL defined.'
+
+
+class GerritQueryError(Exception):
+    message = 'The Gerrit query failed.'
+
+
+class ConfigFileError(Exception):
+    message = 'The configuration file is invalid.'
+
+
+class WebhookConfigurationError(Exception):
+    message = 'A webhook secret is required to receive GitHub webhooks.'
@@ -9,20 +9,184 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+from __future__ import annotations
+
+import datetime
 import json
+import logging
+import threading
+import time
+from typing import TYPE_CHECKING, Iterator, NamedTuple
+
+from gerrit_to_github_issues import errors
+from gerrit_to_github_issues import metrics
+
+if TYPE_CHECKING:
+    from fabric import Connection
+
+LOG = logging.getLogger(__name__)
+
+_connections = {}
+_connections_lock = threading.Lock()
+
+
+class Approval(NamedTuple):
+    type: str
+    value: int
+    by: str
+
+
+class Change(NamedTuple):
+    """The parts of a Gerrit change the sync needs.
+
+    Changes are decoded straight into this compact form so the rest of each
+    JSON record (patch set history, file lists, account objects) is dropped
+    as soon as it is read.
+    """
+    number: int
+    project: str
+    url: str
+    subject: str
+    status: str
+    owner_name: str
+    owner_email: str
+    commit_message: str
+    last_updated: int
+    patch_set: int
+    approvals: tuple
+
+
+def make_change(record: dict) -> Change:
+    owner = record.get('owner', {})
+    patch_set = record.get('currentPatchSet', {})
+    approvals = tuple(Approval(a['type'], int(a['value']), a['by'].get('name') or a['by'].get('username', ''))
+                      for a in patch_set.get('approvals', ()))
+    return Change(
+        number=int(record['number']),
+        project=record.get('project'),
+        url=record.get('url'),
+        subject=record.get('subject'),
+        status=record.get('status'),
+        owner_name=owner.get('name') or owner.get('username', ''),
+        owner_email=owner.get('email', ''),
+        commit_message=record.get('commitMessage'),
+        last_updated=record.get('lastUpdated', 0),
+        patch_set=int(patch_set['number']) if 'number' in patch_set else None,
+        approvals=approvals,
+    )
+
+
+def get_connection(gerrit_url: str, port: int = 29418) -> Connection:
+    # One SSH connection per server is shared by every query in the process;
+    # each query runs on its own channel
+    with _connections_lock:
+        conn = _connections.get((gerrit_url, port))
+        if conn is None:
+            # fabric pulls in paramiko and cryptography, so only load it once
+            # a real connection is needed
+            from fabric import Connection
+            conn = _connections[(gerrit_url, port)] = Connection(gerrit_url, port=port)
+        conn.open()
+    return conn
 
-from fabric import Connection
 
+def set_connection(gerrit_url: str, conn: Connection, port: int = 29418):
+    # Lets callers supply their own connection, e.g. an offline simulator
+    with _connections_lock:
+        _connections[(gerrit_url, port)] = conn
 
-def get_changes(gerrit_url: str, project_name: str, port: int = 29418, change_age: str = None) -> dict:
-    cmd = f'gerrit query --format=JSON --current-patch-set project:{project_name}'
+
+def close_connections():
+    with _connections_lock:
+        for conn in _connections.values():
+            conn.close()
+        _connections.clear()
+
+
+def get_changes(gerrit_url: str, project_names: list, port: int = 29418, change_age: str = None,
+                after: int = None, page_size: int = 500) -> Iterator[Change]:
+    query = ' OR '.join(f'project:{p}' for p in project_names)
+    if len(project_names) > 1:
+        query = f'({query})'
+    if after:
+        query += f' \'after:"{format_timestamp(after)}"\''
     if change_age:
-        cmd += f' -- -age:{change_age}'
-    result = Connection(gerrit_url, port=port).run(cmd)
-    processed_stdout = '{"data":[%s]}' % ','.join(list(filter(None, result.stdout.split('\n'))))
-    data = json.loads(processed_stdout)
-    return data
+        query += f' -- -age:{change_age}'
+    return query_changes(gerrit_url, query, port=port, page_size=page_size)
+
+
+def get_change(gerrit_url: str, change_number: int, port: int = 29418) -> Change:
+    for change in query_changes(gerrit_url, f'change:{change_number}', port=port):
+        return change
+    return None
+
+
+def query_changes(gerrit_url: str, query: str, port: int = 29418, page_size: int = 500) -> Iterator[Change]:
+    # limit: has to come before any "--" in the query
+    query = f'limit:{page_size} {query}'
+    start = 0
+    while True:
+        stats = None
+        conn = get_connection(gerrit_url, port)
+        for record in run_query(conn, f'gerrit query --format=JSON --current-patch-set --start {start} {query}'):
+            if record.get('type') == 'stats':
+                stats = record
+            else:
+                yield make_change(record)
+        if not stats or not stats.get('moreChanges') or not stats.get('rowCount'):
+            return
+        start += stats['rowCount']
+        LOG.debug(f'Fetching next page of changes for "{query}" starting at {start}')
+
+
+def stream_events(gerrit_url: str, port: int = 29418) -> Iterator[dict]:
+    # Runs until the server closes the channel or the connection drops
+    conn = get_connection(gerrit_url, port)
+    yield from run_query(conn, 'gerrit stream-events')
+
+
+def run_query(conn: Connection, cmd: str) -> Iterator[dict]:
+    # Each line of output is a self-contained JSON record, so decode them as
+    # they arrive instead of buffering the whole result set. Only the time
+    # spent waiting on Gerrit is measured, not the time the caller spends
+    # between records.
+    endpoint = ' '.join(cmd.split()[:2])
+    started = time.perf_counter()
+    _, stdout, stderr = conn.client.exec_command(cmd)
+    elapsed, failed = time.perf_counter() - started, False
+    try:
+        lines = iter(stdout)
+        while True:
+            started = time.perf_counter()
+            line = next(lines, None)
+            elapsed += time.perf_counter() - started
+            if line is None:
+                break
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if record.get('type') == 'error':
+                raise errors.GerritQueryError(record.get('message'))
+            yield record
+        exit_status = stdout.channel.recv_exit_status()
+        if exit_status != 0:
+            raise errors.GerritQueryError(stderr.read().decode('utf-8', errors='replace').strip())
+    except Exception:
+        failed = True
+        raise
+    finally:
+        # Callers may stop early (e.g. get_change), so close the channel
+        # rather than leaving it open on the shared connection until GC
+        stdout.channel.close()
+        metrics.record_call('gerrit', endpoint, elapsed, failed)
 
 
 def make_gerrit_url(gerrit_url: str, change_number: str, protocol: str = 'https'):
     return f'{protocol}://{gerrit_url}/{change_number}'
+
+
+def format_timestamp(timestamp: int) -> str:
+    # Gerrit's date operators accept 'YYYY-MM-DD HH:MM:SS +ZZZZ'
+    dt = datetime.datetime.fromtimestamp(timestamp, tz=datetime.timezone.utc)
+    return dt.strftime('%Y-%m-%d %H:%M:%S +0000')
@@ -0,0 +1,185 @@
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+import requests
+from github.Requester import RequestsResponse
+
+from gerrit_to_github_issues import metrics
+from gerrit_to_github_issues import ratelimit
+
+LOG = logging.getLogger(__name__)
+
+MAX_RATE_LIMIT_RETRIES = 3
+
+
+class CachedResponse:
+    # mimic the httplib response object, like PyGithub's RequestsResponse
+    def __init__(self, status: int, headers: dict, text: str):
+        self.status = status
+        self.headers = headers
+        self.text = text
+
+    def getheaders(self):
+        return self.headers.items()
+
+    def read(self):
+        return self.text
+
+
+class ResponseCache:
+    """On-disk cache of GET responses that carry an ETag or Last-Modified.
+
+    Entries are stored one file per request and evicted least recently used
+    first once the directory grows past ``max_bytes``.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 100 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        self.size = sum(e.stat().st_size for e in os.scandir(path) if e.is_file())
+
+    @staticmethod
+    def key(url: str, headers: dict) -> str:
+        # Responses differ by credentials and media type as well as URL
+        parts = [url, headers.get('Authorization', ''), headers.get('Accept', '')]
+        return hashlib.sha256('\0'.join(parts).encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> dict:
+        file_path = os.path.join(self.path, key)
+        try:
+            with open(file_path) as f:
+                entry = json.load(f)
+            os.utime(file_path)
+        except (OSError, ValueError):
+            return None
+        return entry
+
+    def put(self, key: str, entry: dict):
+        file_path = os.path.join(self.path, key)
+        data = json.dumps(entry)
+        tmp_path = f'{file_path}.{threading.get_ident()}.tmp'
+        with self._lock:
+            try:
+                old_size = os.path.getsize(file_path)
+            except OSError:
+                old_size = 0
+            with open(tmp_path, 'w') as f:
+                f.write(data)
+            os.replace(tmp_path, file_path)
+            self.size += os.path.getsize(file_path) - old_size
+            if self.size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        entries = sorted((e for e in os.scandir(self.path) if e.is_file() and not e.name.endswith('.tmp')),
+                         key=lambda e: e.stat().st_mtime)
+        for e in entries:
+            if self.size <= self.max_bytes * 0.9:
+                break
+            size = e.stat().st_size
+            try:
+                os.remove(e.path)
+            except OSError:
+                continue
+            self.size -= size
+        LOG.debug(f'Evicted response cache entries, {self.size} bytes left')
+
+
+def make_connection_class(rate_limiter: ratelimit.RateLimiter, protocol: str = 'https',
+                          cache: ResponseCache = None, session: requests.Session = None):
+    """Builds a PyGithub connection class that throttles and caches requests.
+
+    Every request goes through ``rate_limiter``. GET requests with a cached
+    ETag or Last-Modified value are sent as conditional requests, and a 304
+    is answered from ``cache``. All connections created from the class share
+    one ``requests.Session`` so worker threads reuse pooled HTTP connections;
+    any object with a compatible ``request`` method may be passed instead.
+    """
+    session = session or requests.Session()
+    prefix = f'{protocol}://'
+
+    class GithubConnection:
+        # mimic the httplib connection object, like PyGithub's own classes
+        def __init__(self, host, port=None, strict=False, timeout=None, retry=None, **kwargs):
+            self.host = host
+            self.port = port if port else (443 if protocol == 'https' else 80)
+            self.timeout = timeout
+            self.verify = kwargs.get('verify', True)
+            if retry and not isinstance(session.get_adapter(prefix), RetryAdapter):
+                session.mount(prefix, RetryAdapter(max_retries=retry))
+
+        def request(self, verb, url, input, headers):
+            self.verb = verb
+            self.url = url
+            self.input = input
+            self.headers = headers
+
+        def getresponse(self):
+            headers = dict(self.headers)
+            cache_key, entry = None, None
+            if cache and self.verb == 'GET':
+                cache_key = cache.key(self.url, headers)
+                entry = cache.get(cache_key)
+                if entry and entry.get('etag'):
+                    headers['If-None-Match'] = entry['etag']
+                elif entry and entry.get('last_modified'):
+                    headers['If-Modified-Since'] = entry['last_modified']
+
+            for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+                rate_limiter.acquire()
+                started = time.perf_counter()
+                r = session.request(self.verb, f'{prefix}{self.host}:{self.port}{self.url}',
+                                    headers=headers, data=self.input, timeout=self.timeout,
+                                    verify=self.verify, allow_redirects=False)
+                if metrics.enabled():
+                    metrics.record_call('github', metrics.endpoint_template(self.verb, self.url),
+                                        time.perf_counter() - started, r.status_code >= 400)
+                delay = rate_limiter.update(r.headers, r.status_code, r.text if r.status_code >= 400 else '')
+                if not delay or attempt == MAX_RATE_LIMIT_RETRIES:
+                    break
+                metrics.incr('github_rate_limit_retries')
+                LOG.warning(f'GitHub rate limit hit on {self.verb} {self.url}, retrying in {int(delay)}s')
+            metrics.set_gauge('github_rate_limit_remaining', rate_limiter.remaining)
+            metrics.set_gauge('github_rate_limit_limit', rate_limiter.limit)
+
+            if r.status_code == 304 and entry:
+                metrics.incr('github_cache_hits')
+                # Serve the cached body, but with this response's rate-limit headers
+                cached_headers = dict(entry['headers'])
+                cached_headers.update((k, v) for k, v in r.headers.items() if k.lower().startswith('x-ratelimit'))
+                return CachedResponse(entry['status'], cached_headers, entry['body'])
+            if cache_key and r.status_code == 200 and ('ETag' in r.headers or 'Last-Modified' in r.headers):
+                cache.put(cache_key, {
+                    'etag': r.headers.get('ETag'),
+                    'last_modified': r.headers.get('Last-Modified'),
+                    'status': r.status_code,
+                    'headers': dict(r.headers),
+                    'body': r.text,
+                })
+            return RequestsResponse(r)
+
+        def close(self):
+            return
+
+    return GithubConnection
+
+
+class RetryAdapter(requests.adapters.HTTPAdapter):
+    pass
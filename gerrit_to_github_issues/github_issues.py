@@ -9,15 +9,28 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import calendar
 from datetime import datetime
 import logging
 import re
+import string
+import time
+from typing import NamedTuple
 
 import github
 from github.Issue import Issue
 from github.IssueComment import IssueComment
+from github.Project import Project
+from github.ProjectCard import ProjectCard
+from github.ProjectColumn import ProjectColumn
+from github.Repository import Repository
+from github.Requester import Requester
 
+from gerrit_to_github_issues import checkpoint
 from gerrit_to_github_issues import errors
+from gerrit_to_github_issues import github_http
+from gerrit_to_github_issues import metrics
+from gerrit_to_github_issues import ratelimit
 
 LOG = logging.getLogger(__name__)
 
@@ -32,27 +45,87 @@ def construct_issue_list(match_list: list) -> list:
     return new_list
 
 
-def parse_issue_number(commit_msg: str) -> dict:
-    # Searches for Relates-To or Closes tags first to match and return
-    LOG.debug(f'Parsing commit message: {commit_msg}')
-    related = re.findall(r'(?<=Relates-To: #)(.*?)(?=\n)', commit_msg)
-    LOG.debug(f'Captured related issues: {related}')
-    closes = re.findall(r'(?<=Closes: #)(.*?)(?=\n)', commit_msg)
-    LOG.debug(f'Captured closes issues: {closes}')
-    if related or closes:
-        return {
-            'related': construct_issue_list(related),
-            'closes': construct_issue_list(closes)
-        }
-    # If no Relates-To or Closes tags are defined, find legacy [#X] style tags
-    LOG.debug('Falling back to legacy tags')
-    legacy_matches = re.findall(r'(?<=\[#)(.*?)(?=\])', commit_msg)
-    LOG.debug(f'Captured legacy issues: {legacy_matches}')
-    if not legacy_matches:
+class CommitTags(NamedTuple):
+    related: list
+    closes: list
+    legacy: list
+    wip: bool
+    cross_repo: list
+
+    def issue_numbers(self) -> dict:
+        # Relates-To and Closes tags take precedence over legacy [#X] tags
+        if self.related or self.closes:
+            return {'related': self.related, 'closes': self.closes}
+        if self.legacy:
+            return {'related': self.legacy}
         return {}
-    return {
-        'related': construct_issue_list(legacy_matches)
-    }
+
+
+# One pattern covers every tag so a message is scanned exactly once. Every
+# tag is anchored on its "#", which lets the regex engine skip straight to
+# candidate positions, and the text before it is checked with lookbehinds.
+# Tag values are captured in lookaheads, together with the character that
+# ends them so a captured value is never empty, and scanning continues
+# inside them, which finds tags in a value just like the separate scans
+# this replaced. Values run to the end of the line (or the closing bracket),
+# as they always have. org/repo#N references only flag that the message
+# needs a second look.
+TAG_RE = re.compile(
+    r'#(?:(?<=Relates-To: #)(?=([^\n]*\n))'
+    r'|(?<=Closes: #)(?=([^\n]*\n))'
+    r'|(?<=\[#)(?=([^\]\n]*\]))'
+    r'|(?<=[\w.-]#)(?=\d))'
+)
+CROSS_REPO_RE = re.compile(r'/(?=([\w.-]+)#(\d+))')
+REPO_CHARS = frozenset(string.ascii_letters + string.digits + '_.-')
+
+
+def parse_commit_message(commit_msg: str) -> CommitTags:
+    related, closes, legacy = [], [], []
+    # Tags of one kind never overlap, e.g. "[#1 [#2]" is one legacy tag. A
+    # tag inside the previous one's value is the tail of that value.
+    last_related = last_closes = last_legacy = ''
+    repo_refs = False
+    for related_value, closes_value, legacy_value in TAG_RE.findall(commit_msg):
+        if related_value:
+            if not last_related.endswith('Relates-To: #' + related_value):
+                related.append(related_value[:-1])
+            last_related = related_value
+        elif closes_value:
+            if not last_closes.endswith('Closes: #' + closes_value):
+                closes.append(closes_value[:-1])
+            last_closes = closes_value
+        elif legacy_value:
+            if not last_legacy.endswith('[#' + legacy_value):
+                legacy.append(legacy_value[:-1])
+            last_legacy = legacy_value
+        else:
+            repo_refs = True
+    # Legacy tags only count when there are no newer tags at all, even ones
+    # that fail to parse
+    if related or closes:
+        legacy = []
+    return CommitTags(construct_issue_list(related) if related else [],
+                      construct_issue_list(closes) if closes else [],
+                      construct_issue_list(legacy) if legacy else [],
+                      'WIP' in commit_msg or 'DNM' in commit_msg,
+                      parse_cross_repo(commit_msg) if repo_refs else [])
+
+
+def parse_cross_repo(commit_msg: str) -> list:
+    # Returns an (org/repo, issue number) pair per reference
+    cross_repo = []
+    for match in CROSS_REPO_RE.finditer(commit_msg):
+        owner_start = match.start()
+        while owner_start and commit_msg[owner_start - 1] in REPO_CHARS:
+            owner_start -= 1
+        if owner_start < match.start():
+            cross_repo.append((f'{commit_msg[owner_start:match.start()]}/{match.group(1)}', int(match.group(2))))
+    return cross_repo
+
+
+def parse_issue_number(commit_msg: str) -> dict:
+    return parse_commit_message(commit_msg).issue_numbers()
 
 
 def remove_duplicated_issue_numbers(issue_dict: dict) -> dict:
@@ -61,35 +134,139 @@ def remove_duplicated_issue_numbers(issue_dict: dict) -> dict:
     return issue_dict
 
 
-def get_client(github_user: str, github_pw: str, github_token: str) -> github.Github:
+def get_client(github_user: str, github_pw: str, github_token: str,
+               rate_limiter: ratelimit.RateLimiter = None,
+               cache: github_http.ResponseCache = None, session=None) -> github.Github:
+    if rate_limiter:
+        Requester.injectConnectionClasses(github_http.make_connection_class(rate_limiter, 'http', cache, session),
+                                          github_http.make_connection_class(rate_limiter, 'https', cache, session))
+
     if github_token:
-        return github.Github(github_token)
+        return github.Github(github_token, per_page=100)
 
     if github_user and github_pw:
-        return github.Github(github_user, github_pw)
+        return github.Github(github_user, github_pw, per_page=100)
 
     raise errors.GithubConfigurationError
 
 
+class BoardIndex:
+    """Maps issues to their card and column on a project board.
+
+    The board is listed once per run and shared by every repo whose issues
+    are on it; card content is resolved from each card's ``content_url``
+    rather than fetching the issue behind every card.
+    """
+
+    def __init__(self, project_board: Project):
+        self.project_board = project_board
+        self.columns = {}
+        self.cards = {}
+        for col in project_board.get_columns():
+            self.columns[col.name] = col
+            for card in col.get_cards():
+                content_url = card.content_url
+                if not content_url or '/issues/' not in content_url:
+                    continue
+                self.cards[content_url] = (card, col)
+        LOG.debug(f'Indexed {len(self.cards)} issue cards across {len(self.columns)} columns '
+                  f'of project "{project_board.name}"')
+
+    def get_column(self, col_name: str) -> ProjectColumn:
+        return self.columns.get(col_name)
+
+    def get_card(self, issue_url: str) -> (ProjectCard, ProjectColumn):
+        return self.cards.get(issue_url, (None, None))
+
+    def card_moved(self, issue_url: str, card: ProjectCard, to_col: ProjectColumn):
+        self.cards[issue_url] = (card, to_col)
+
+
+def issue_url(repo: Repository, issue_number: int) -> str:
+    # The API URL of an issue, as used in a project card's content_url
+    return f'{repo.url}/issues/{issue_number}'
+
+
+def is_change_comment(body: str, change_number) -> bool:
+    # Match the "## Related Change [#N](url)" header rather than the bare
+    # number, which also turns up in timestamps and other change numbers
+    return f'[#{change_number}](' in body
+
+
 def get_bot_comment(issue: Issue, bot_name: str, ps_number: str) -> IssueComment:
+    return get_bot_comments(issue, bot_name, [ps_number]).get(ps_number)
+
+
+@metrics.traced
+def get_bot_comments(issue: Issue, bot_name: str, change_numbers: list) -> dict:
+    # Finds the bot comment of each change in a single pass over the issue's
+    # comments, returning them by change number
+    found = {}
     for i in issue.get_comments():
-        if i.user.login == bot_name and ps_number in i.body:
-            return i
+        if i.user.login != bot_name:
+            continue
+        for number in change_numbers:
+            if number not in found and is_change_comment(i.body, number):
+                found[number] = i
+        if len(found) == len(change_numbers):
+            break
+    return found
 
 
-def assign_issues(repo: github.Repository):
-    open_issues = [i for i in repo.get_issues() if i.state == 'open']
-    for issue in open_issues:
-        try_assign(issue)
+@metrics.traced
+def assign_issues(repo: github.Repository, store: checkpoint.CheckpointStore = None):
+    if not store:
+        for issue in repo.get_issues(state='open'):
+            try_assign(issue)
+        return
 
+    scope = f'{repo.full_name}#assign'
+    since = store.get_cursor(scope)
+    if since is None:
+        # Nothing to resume from, so scan every open issue once and only read
+        # new comments from then on
+        started = int(time.time())
+        for issue in repo.get_issues(state='open'):
+            try_assign(issue)
+        store.set_cursor(scope, started)
+        return
 
-def try_assign(issue: github.Issue):
-    # find the most recent assignment request
-    assignment_request = None
-    for comment in issue.get_comments().reversed:
-        if '/assign' in comment.body:
-            assignment_request = comment
-            break
+    # since is inclusive and only has second precision, so the comments from
+    # the cursor's last second are read again on the next run. Comment ids
+    # only grow, so the last one seen tells those apart from comments posted
+    # later in that same second.
+    last_comment_id = store.get_cursor(f'{scope}-comment') or 0
+
+    # The comments feed is ordered by update time, so the newest request for
+    # each issue wins. Edits to older comments are not new requests.
+    assignment_requests = {}
+    newest, newest_comment_id = since, last_comment_id
+    for comment in repo.get_issues_comments(sort='updated', direction='asc',
+                                            since=datetime.utcfromtimestamp(since)):
+        newest = max(newest, calendar.timegm(comment.updated_at.utctimetuple()))
+        if comment.id <= last_comment_id:
+            continue
+        newest_comment_id = max(newest_comment_id, comment.id)
+        if '/assign' in comment.body and calendar.timegm(comment.created_at.utctimetuple()) >= since:
+            assignment_requests[int(comment.issue_url.rsplit('/', 1)[1])] = comment
+    LOG.debug(f'Found {len(assignment_requests)} new assignment requests since {since}')
+
+    for issue_number, comment in assignment_requests.items():
+        issue = repo.get_issue(issue_number)
+        if issue.state == 'open':
+            try_assign(issue, comment)
+    store.set_cursor(f'{scope}-comment', newest_comment_id)
+    store.set_cursor(scope, newest)
+
+
+@metrics.traced
+def try_assign(issue: github.Issue, assignment_request: IssueComment = None):
+    if not assignment_request:
+        # find the most recent assignment request
+        for comment in issue.get_comments().reversed:
+            if '/assign' in comment.body:
+                assignment_request = comment
+                break
     if not assignment_request:
         # Looks like no one wants this issue
         return
@@ -108,7 +285,7 @@ def try_assign(issue: github.Issue):
         for assignee in old_assignees:
             issue.remove_from_assignees(assignee)
         issue.add_to_assignees(assignment_request.user)
-        comment_body = f'unassigned: {", ".join([a for a in old_assignees])}\n' + \
+        comment_body = f'unassigned: {", ".join([a.login for a in old_assignees])}\n' + \
                        f'assigned: {assignment_request.user.login}'
         issue.create_comment(comment_body)
         return
@@ -0,0 +1,284 @@
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import bisect
+import collections
+import contextlib
+import datetime
+import functools
+import json
+import logging
+import re
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+LOG = logging.getLogger(__name__)
+
+PREFIX = 'gerrit_to_github'
+BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# The active registry; None while metrics are disabled, which every helper
+# below checks first so instrumented code pays almost nothing
+_registry = None
+_local = threading.local()
+
+_REPO_PATH_RE = re.compile(r'^/repos/[^/]+/[^/]+')
+_ID_RE = re.compile(r'/\d+(?=/|$)')
+_LABEL_PATH_RE = re.compile(r'/labels/[^/]+$')
+
+
+class Histogram:
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.errors = 0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def observe(self, seconds: float, error: bool = False):
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+        self.errors += error
+        self.buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+
+    def cumulative(self) -> list:
+        total, result = 0, []
+        for bound, count in zip(BUCKETS + (float('inf'),), self.buckets):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class Metrics:
+    """Counts and times the outbound calls, phases and work items of a run.
+
+    Calls are keyed by service, operation (the sync step that made them,
+    see ``operation``) and endpoint. The registry can be dumped as a JSON
+    summary or rendered in the Prometheus text format.
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.calls = collections.defaultdict(Histogram)
+        self.phases = collections.defaultdict(float)
+        self.counters = collections.Counter()
+        self.gauges = {}
+        self._lock = threading.Lock()
+
+    def observe_call(self, service: str, operation: str, endpoint: str, seconds: float, error: bool = False):
+        with self._lock:
+            self.calls[(service, operation, endpoint)].observe(seconds, error)
+
+    def add_phase(self, name: str, seconds: float):
+        with self._lock:
+            self.phases[name] += seconds
+
+    def incr(self, name: str, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def set_gauge(self, name: str, value):
+        with self._lock:
+            self.gauges[name] = value
+
+    def summary(self) -> dict:
+        with self._lock:
+            calls = sorted(self.calls.items(), key=lambda c: c[1].sum, reverse=True)
+            totals = collections.defaultdict(lambda: {'count': 0, 'errors': 0, 'seconds': 0.0})
+            for (service, _, _), h in calls:
+                totals[service]['count'] += h.count
+                totals[service]['errors'] += h.errors
+                totals[service]['seconds'] = round(totals[service]['seconds'] + h.sum, 6)
+            return {
+                'started_at': datetime.datetime.fromtimestamp(self.started_at, datetime.timezone.utc).isoformat(),
+                'duration_seconds': round(time.time() - self.started_at, 3),
+                'phases': {name: round(seconds, 6) for name, seconds in self.phases.items()},
+                'counters': dict(self.counters),
+                'gauges': dict(self.gauges),
+                'calls': dict(totals),
+                'operations': [{
+                    'service': service,
+                    'operation': operation,
+                    'endpoint': endpoint,
+                    'count': h.count,
+                    'errors': h.errors,
+                    'seconds': round(h.sum, 6),
+                    'max_seconds': round(h.max, 6),
+                    'buckets': {format_bound(bound): count for bound, count in h.cumulative()},
+                } for (service, operation, endpoint), h in calls],
+            }
+
+    def render_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            lines += [f'# HELP {PREFIX}_call_duration_seconds Outbound GitHub and Gerrit calls by operation.',
+                      f'# TYPE {PREFIX}_call_duration_seconds histogram']
+            for key, h in sorted(self.calls.items()):
+                labels = format_labels(service=key[0], operation=key[1], endpoint=key[2])
+                for bound, count in h.cumulative():
+                    bucket_labels = format_labels(service=key[0], operation=key[1], endpoint=key[2],
+                                                  le=format_bound(bound))
+                    lines.append(f'{PREFIX}_call_duration_seconds_bucket{bucket_labels} {count}')
+                lines.append(f'{PREFIX}_call_duration_seconds_sum{labels} {h.sum}')
+                lines.append(f'{PREFIX}_call_duration_seconds_count{labels} {h.count}')
+            lines += [f'# TYPE {PREFIX}_call_errors_total counter']
+            for key, h in sorted(self.calls.items()):
+                labels = format_labels(service=key[0], operation=key[1], endpoint=key[2])
+                lines.append(f'{PREFIX}_call_errors_total{labels} {h.errors}')
+            lines += [f'# TYPE {PREFIX}_phase_seconds_total counter']
+            for name, seconds in sorted(self.phases.items()):
+                lines.append(f'{PREFIX}_phase_seconds_total{format_labels(phase=name)} {seconds}')
+            for name, value in sorted(self.counters.items()):
+                lines += [f'# TYPE {PREFIX}_{name}_total counter', f'{PREFIX}_{name}_total {value}']
+            for name, value in sorted(self.gauges.items()):
+                if value is not None:
+                    lines += [f'# TYPE {PREFIX}_{name} gauge', f'{PREFIX}_{name} {value}']
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsServer:
+    """Serves the active registry in the Prometheus text format on ``/metrics``."""
+
+    def __init__(self, port: int, host: str = ''):
+        self.httpd = HTTPServer((host, port), self._make_handler())
+
+    @staticmethod
+    def _make_handler():
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics' or _registry is None:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                body = _registry.render_prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                LOG.debug(format % args)
+
+        return Handler
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, name='metrics-server', daemon=True).start()
+        LOG.info(f'Serving metrics on port {self.httpd.server_address[1]}')
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def enable() -> Metrics:
+    global _registry
+    if _registry is None:
+        _registry = Metrics()
+    return _registry
+
+
+def disable():
+    global _registry
+    _registry = None
+
+
+def enabled() -> bool:
+    return _registry is not None
+
+
+def record_call(service: str, endpoint: str, seconds: float, error: bool = False):
+    if _registry is None:
+        return
+    _registry.observe_call(service, getattr(_local, 'operation', None) or 'other', endpoint, seconds, error)
+
+
+def incr(name: str, value=1):
+    if _registry is None:
+        return
+    _registry.incr(name, value)
+
+
+def set_gauge(name: str, value):
+    if _registry is None:
+        return
+    _registry.set_gauge(name, value)
+
+
+@contextlib.contextmanager
+def operation(name: str):
+    # Labels the calls made by this thread until the block exits
+    if _registry is None:
+        yield
+        return
+    previous = getattr(_local, 'operation', None)
+    _local.operation = name
+    try:
+        yield
+    finally:
+        _local.operation = previous
+
+
+@contextlib.contextmanager
+def phase(name: str):
+    # Times a step of the run and labels the calls made in it
+    if _registry is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        with operation(name):
+            yield
+    finally:
+        _registry.add_phase(name, time.perf_counter() - started)
+
+
+def traced(fn):
+    """Labels the calls made by ``fn`` with its name."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if _registry is None:
+            return fn(*args, **kwargs)
+        with operation(fn.__name__):
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+def endpoint_template(verb: str, url: str) -> str:
+    # Collapses repo names, ids and label names so calls group by endpoint,
+    # e.g. "POST /repos/{repo}/issues/{id}/comments"
+    path = urllib.parse.urlsplit(url).path
+    path = _REPO_PATH_RE.sub('/repos/{repo}', path)
+    path = _LABEL_PATH_RE.sub('/labels/{name}', path)
+    return f'{verb} {_ID_RE.sub("/{id}", path)}'
+
+
+def write_summary(path: str):
+    if _registry is None:
+        return
+    with open(path, 'w') as f:
+        json.dump(_registry.summary(), f, indent=2)
+    LOG.info(f'Wrote run metrics to {path}')
+
+
+def format_bound(bound: float) -> str:
+    return '+Inf' if bound == float('inf') else str(bound)
+
+
+def format_labels(**labels) -> str:
+    return '{' + ','.join(f'{k}="{escape_label(v)}"' for k, v in labels.items()) + '}'
+
+
+def escape_label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
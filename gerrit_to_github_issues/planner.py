@@ -0,0 +1,103 @@
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import re
+
+WIP_LABEL = 'wip'
+REVIEW_LABEL = 'ready for review'
+WIP_COLUMN = 'In Progress'
+REVIEW_COLUMN = 'Submitted on Gerrit'
+REOPEN_COMMENT = 'Issue reopened due to new activity on Gerrit.\n\n'
+CLOSES_SUFFIX = '\n\nThis change will close this issue when merged.'
+
+VOLATILE_RE = re.compile(r'\*Last Updated: [^*\n]*\*')
+
+
+def strip_volatile(body: str) -> str:
+    # Drop fields that change on every run, such as the "Last Updated" stamp
+    return VOLATILE_RE.sub('', body).strip()
+
+
+class IssuePlan:
+    """The writes needed to bring one issue to its desired state.
+
+    ``comments`` holds one ``(comment_id, body)`` pair per bot comment to
+    write, with a comment_id of None for a new comment. An empty plan means
+    the issue already matches its changes and nothing should be sent to
+    GitHub.
+    """
+    __slots__ = ('issue_number', 'reopen', 'add_labels', 'remove_labels', 'column', 'comments')
+
+    def __init__(self, issue_number: int):
+        self.issue_number = issue_number
+        self.reopen = False
+        self.add_labels = []
+        self.remove_labels = []
+        self.column = None
+        self.comments = []
+
+    def is_noop(self) -> bool:
+        return not (self.reopen or self.add_labels or self.remove_labels or self.column or self.comments)
+
+    def describe(self) -> str:
+        if self.is_noop():
+            return f'#{self.issue_number}: up to date'
+        actions = []
+        if self.reopen:
+            actions.append('reopen')
+        actions.extend(f'add label `{l}`' for l in self.add_labels)
+        actions.extend(f'remove label `{l}`' for l in self.remove_labels)
+        if self.column:
+            actions.append(f'move to "{self.column}"')
+        actions.extend(f'edit comment {comment_id}' if comment_id else 'post comment'
+                       for comment_id, _ in self.comments)
+        return f'#{self.issue_number}: ' + ', '.join(actions)
+
+
+def plan_issue(issue_number: int, state: str, labels: set, column: str, columns, is_wip: bool,
+               comments: list) -> IssuePlan:
+    """Plans one issue against every change linked to it.
+
+    ``column`` is the board column of the issue's card, or None if it has
+    no card, and ``columns`` holds the names of the board's columns; the card
+    is only moved when both it and its target column exist.
+
+    ``is_wip`` is the combined state of those changes, or None to leave the
+    labels and column alone, and ``comments`` holds a ``(comment_id,
+    comment_body, comment_msg, key)`` tuple per change whose comment should
+    be checked, where comment_id and comment_body describe the change's
+    existing bot comment, if any.
+    """
+    plan = IssuePlan(issue_number)
+    plan.reopen = state == 'closed' and any(not comment_id for comment_id, _, _, _ in comments)
+    if is_wip is not None:
+        plan_state(plan, labels, column, columns, is_wip)
+
+    for comment_id, comment_body, comment_msg, key in comments:
+        if key == 'closes':
+            comment_msg += CLOSES_SUFFIX
+        if not comment_id:
+            plan.comments.append((None, comment_msg))
+        elif strip_volatile(comment_msg) != strip_volatile(comment_body):
+            plan.comments.append((comment_id, comment_msg))
+    return plan
+
+
+def plan_state(plan: IssuePlan, labels: set, column: str, columns, is_wip: bool):
+    wanted, unwanted = (WIP_LABEL, REVIEW_LABEL) if is_wip else (REVIEW_LABEL, WIP_LABEL)
+    if wanted not in labels:
+        plan.add_labels.append(wanted)
+    if unwanted in labels:
+        plan.remove_labels.append(unwanted)
+
+    to_column = WIP_COLUMN if is_wip else REVIEW_COLUMN
+    if column is not None and column != to_column and to_column in columns:
+        plan.column = to_column
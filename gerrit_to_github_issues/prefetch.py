@@ -0,0 +1,109 @@
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import logging
+
+import github
+from github.Issue import Issue
+from github.IssueComment import IssueComment
+from github.Repository import Repository
+
+from gerrit_to_github_issues import github_issues
+
+LOG = logging.getLogger(__name__)
+
+ISSUE_FIELDS = '''
+fragment IssueFields on Issue {
+  number
+  state
+  labels(first: 100) { nodes { name } }
+  comments(last: 100) {
+    pageInfo { hasPreviousPage }
+    nodes { databaseId body author { login } }
+  }
+}
+'''
+
+
+class IssueSnapshot:
+    """In-memory view of an issue's state, labels and bot comments.
+
+    ``complete`` is False when the issue has more comments than were fetched,
+    in which case bot comments must still be looked up over REST.
+    """
+    __slots__ = ('number', 'state', 'labels', 'bot_comments', 'complete')
+
+    def __init__(self, number: int, state: str, labels: set, bot_comments: dict, complete: bool):
+        self.number = number
+        self.state = state
+        self.labels = labels
+        self.bot_comments = bot_comments
+        self.complete = complete
+
+    def find_bot_comment(self, change_number) -> (int, str):
+        for comment_id, body in self.bot_comments.items():
+            if github_issues.is_change_comment(body, change_number):
+                return comment_id, body
+        return None, None
+
+
+def graphql_url(repo: Repository) -> str:
+    # GitHub Enterprise serves GraphQL from /api/graphql next to /api/v3
+    api_url = repo.url[:repo.url.index('/repos/')]
+    if api_url.endswith('/api/v3'):
+        return api_url[:-len('v3')] + 'graphql'
+    return api_url + '/graphql'
+
+
+def prefetch_issues(repo: Repository, issue_numbers: list, bot_login: str, batch_size: int = 50) -> dict:
+    snapshots = {}
+    issue_numbers = sorted(set(issue_numbers))
+    for i in range(0, len(issue_numbers), batch_size):
+        batch = issue_numbers[i:i + batch_size]
+        fields = '\n'.join(f'i{n}: issue(number: {n}) {{ ...IssueFields }}' for n in batch)
+        query = 'query($owner: String!, $name: String!) {\n' \
+                f'  repository(owner: $owner, name: $name) {{\n{fields}\n  }}\n}}\n' + ISSUE_FIELDS
+        try:
+            _, data = repo._requester.requestJsonAndCheck(
+                'POST', graphql_url(repo),
+                input={'query': query, 'variables': {'owner': repo.owner.login, 'name': repo.name}})
+        except github.GithubException as e:
+            LOG.warning(f'Failed to prefetch issues {batch[0]}-{batch[-1]}, falling back to REST: {e}')
+            continue
+        repository = (data.get('data') or {}).get('repository') or {}
+        for node in repository.values():
+            # Missing issues and pull requests come back as null and are left
+            # to the REST path
+            if not node:
+                continue
+            bot_comments = {c['databaseId']: c['body'] for c in node['comments']['nodes']
+                            if c['author'] and c['author']['login'] == bot_login}
+            snapshots[node['number']] = IssueSnapshot(
+                number=node['number'],
+                state=node['state'].lower(),
+                labels={l['name'] for l in node['labels']['nodes']},
+                bot_comments=bot_comments,
+                complete=not node['comments']['pageInfo']['hasPreviousPage'])
+    LOG.debug(f'Prefetched {len(snapshots)} of {len(issue_numbers)} issues')
+    return snapshots
+
+
+def make_issue(repo: Repository, issue_number: int) -> Issue:
+    # A lazy issue lets mutations go straight to the API without first
+    # fetching the issue
+    return Issue(repo._requester, {}, {'number': issue_number, 'url': f'{repo.url}/issues/{issue_number}'},
+                 completed=False)
+
+
+def make_issue_comment(repo: Repository, comment_id: int, body: str) -> IssueComment:
+    return IssueComment(repo._requester, {},
+                        {'id': comment_id, 'body': body, 'url': f'{repo.url}/issues/comments/{comment_id}'},
+                        completed=False)
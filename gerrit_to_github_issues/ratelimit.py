@@ -0,0 +1,94 @@
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import logging
+import threading
+import time
+
+from gerrit_to_github_issues import metrics
+
+LOG = logging.getLogger(__name__)
+
+# GitHub asks clients to wait at least a minute after hitting a secondary
+# rate limit that does not come with a Retry-After header
+SECONDARY_LIMIT_DELAY = 60
+
+
+class RateLimiter:
+    """A GitHub rate-limit budget shared by every thread using a client.
+
+    The budget is refreshed from the ``X-RateLimit-*`` headers of each
+    response. Once the budget falls below ``pace_below`` of the limit, the
+    remaining requests are spread over the rest of the window; once only
+    ``reserve`` are left, callers block until the window resets. Secondary
+    limits pause every caller for the time GitHub asks for.
+    """
+
+    def __init__(self, reserve: int = 50, pace_below: float = 0.1):
+        self.reserve = reserve
+        self.pace_below = pace_below
+        self.remaining = None
+        self.limit = None
+        self.reset_at = 0
+        self.paused_until = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.time()
+            delay = self.paused_until - now
+            exhausted = self.remaining is not None and self.remaining <= self.reserve
+            if exhausted:
+                delay = max(delay, self.reset_at - now)
+            elif self.remaining is not None and self.limit and self.remaining < self.limit * self.pace_below:
+                delay = max(delay, (self.reset_at - now) / (self.remaining - self.reserve))
+            if delay > 0:
+                if delay >= 1:
+                    LOG.warning(f'Throttling GitHub requests for {int(delay)}s '
+                                f'({self.remaining} of {self.limit} requests left)')
+                # Sleeping with the lock held pauses every worker, which is the point
+                time.sleep(delay)
+                metrics.incr('github_throttled_seconds', delay)
+            if exhausted:
+                self.remaining = None
+            if self.remaining is not None:
+                self.remaining -= 1
+
+    def update(self, headers, status: int = 200, body: str = '') -> float:
+        """Records a response's rate-limit headers.
+
+        Returns the number of seconds to wait before retrying the request, or
+        0 if the response is not a rate-limit rejection.
+        """
+        remaining = headers.get('X-RateLimit-Remaining')
+        limit = headers.get('X-RateLimit-Limit')
+        reset_at = headers.get('X-RateLimit-Reset')
+        retry_after = headers.get('Retry-After')
+        with self._lock:
+            if remaining is not None:
+                self.remaining = int(remaining)
+            if limit is not None:
+                self.limit = int(limit)
+            if reset_at is not None:
+                self.reset_at = int(reset_at)
+            if status not in (403, 429):
+                return 0
+            now = time.time()
+            if retry_after is not None:
+                delay = int(retry_after)
+            elif remaining == '0':
+                delay = max(self.reset_at - now, 1)
+            elif 'secondary rate limit' in body.lower() or 'abuse' in body.lower():
+                delay = SECONDARY_LIMIT_DELAY
+            else:
+                return 0
+            self.paused_until = max(self.paused_until, now + delay)
+            return delay
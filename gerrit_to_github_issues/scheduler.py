@@ -0,0 +1,90 @@
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import collections
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+
+LOG = logging.getLogger(__name__)
+
+
+class KeyedScheduler:
+    """Runs tasks on a bounded thread pool while keeping tasks that share a key in order.
+
+    Tasks submitted with the same key (e.g. an issue number) are queued and
+    run one at a time, in submission order, by a single worker; tasks with
+    different keys run concurrently. With one worker, tasks run inline.
+    """
+
+    def __init__(self, workers: int = 1):
+        self.workers = max(1, workers)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers) if self.workers > 1 else None
+        self._lock = threading.Lock()
+        self._queues = {}
+        self._outstanding = set()
+        self._error = None
+
+    def submit(self, key, fn, *args, **kwargs) -> Future:
+        future = Future()
+        with self._lock:
+            self._outstanding.add(future)
+        future.add_done_callback(self._task_done)
+        if self.executor is None:
+            self._run(future, fn, args, kwargs)
+            return future
+        with self._lock:
+            queue = self._queues.get(key)
+            if queue is None:
+                self._queues[key] = collections.deque([(future, fn, args, kwargs)])
+                self.executor.submit(self._drain, key)
+            else:
+                queue.append((future, fn, args, kwargs))
+        return future
+
+    def _drain(self, key):
+        while True:
+            with self._lock:
+                queue = self._queues[key]
+                if not queue:
+                    del self._queues[key]
+                    return
+                future, fn, args, kwargs = queue.popleft()
+            self._run(future, fn, args, kwargs)
+
+    @staticmethod
+    def _run(future: Future, fn, args, kwargs):
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            LOG.exception(f'Task {fn.__name__} failed')
+            future.set_exception(e)
+
+    def _task_done(self, future: Future):
+        # Only unfinished tasks and the first failure are kept, so a
+        # long-running scheduler does not grow without bound
+        with self._lock:
+            self._outstanding.discard(future)
+            if self._error is None and not future.cancelled() and future.exception():
+                self._error = future.exception()
+
+    def shutdown(self):
+        # Wait for every task, then surface the first failure so a broken run
+        # still exits non-zero
+        with self._lock:
+            outstanding = list(self._outstanding)
+        wait(outstanding)
+        if self.executor is not None:
+            self.executor.shutdown()
+        if self._error is not None:
+            raise self._error
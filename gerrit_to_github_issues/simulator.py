@@ -0,0 +1,496 @@
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import collections
+import datetime
+import hashlib
+import io
+import json
+import random
+import re
+import threading
+import time
+import urllib.parse
+
+API_URL = 'https://api.github.com'
+COLUMN_NAMES = ('Backlog', 'In Progress', 'Submitted on Gerrit', 'Done')
+
+
+def iso_timestamp(timestamp: float) -> str:
+    return datetime.datetime.utcfromtimestamp(timestamp).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+class FakeResponse:
+    # mimic the parts of requests.Response read by github_http
+    def __init__(self, status_code: int, headers: dict, text: str):
+        self.status_code = status_code
+        self.headers = headers
+        self.text = text
+
+
+class FakeGitHub:
+    """In-memory stand-in for the GitHub REST and GraphQL endpoints the sync uses.
+
+    It models repos, labels, issues, comments, assignees, project boards and
+    cards, with Link-header pagination, ETags and rate-limit headers. It is
+    used in place of a ``requests.Session`` (see ``github_issues.get_client``)
+    and counts every call by endpoint in ``calls``.
+    """
+
+    def __init__(self, bot_login: str = 'sync-bot', rate_limit: int = 5000):
+        self.bot_login = bot_login
+        self.rate_limit = rate_limit
+        self.remaining = rate_limit
+        self.reset_at = int(time.time()) + 3600
+        self.calls = collections.Counter()
+        self.repos = {}
+        self.projects = {}
+        self.columns = {}
+        self.cards = {}
+        self.comments = {}
+        self.rejections = collections.deque()
+        self._ids = iter(range(1000, 10 ** 12))
+        self._lock = threading.RLock()
+        self.routes = [
+            ('GET', r'/user', self.get_user),
+            ('POST', r'/graphql', self.graphql),
+            ('GET', r'/repos/(?P<owner>[^/]+)/(?P<repo>[^/]+)', self.get_repo),
+            ('GET', r'/repos/(?P<owner>[^/]+)/(?P<repo>[^/]+)/labels', self.list_repo_labels),
+            ('GET', r'/repos/(?P<owner>[^/]+)/(?P<repo>[^/]+)/issues', self.list_issues),
+            ('GET', r'/repos/(?P<owner>[^/]+)/(?P<repo>[^/]+)/issues/comments', self.list_repo_comments),
+            ('GET', r'/repos/(?P<owner>[^/]+)/(?P<repo>[^/]+)/issues/comments/(?P<id>\d+)', self.get_comment),
+            ('PATCH', r'/repos/(?P<owner>[^/]+)/(?P<repo>[^/]+)/issues/comments/(?P<id>\d+)', self.edit_comment),
+            ('GET', r'/repos/(?P<owner>[^/]+)/(?P<repo>[^/]+)/issues/(?P<number>\d+)', self.get_issue),
+            ('PATCH', r'/repos/(?P<owner>[^/]+)/(?P<repo>[^/]+)/issues/(?P<number>\d+)', self.edit_issue),
+            ('GET', r'/repos/(?P<owner>[^/]+)/(?P<repo>[^/]+)/issues/(?P<number>\d+)/comments',
+             self.list_issue_comments),
+            ('POST', r'/repos/(?P<owner>[^/]+)/(?P<repo>[^/]+)/issues/(?P<number>\d+)/comments',
+             self.create_comment),
+            ('GET', r'/repos/(?P<owner>[^/]+)/(?P<repo>[^/]+)/issues/(?P<number>\d+)/labels',
+             self.list_issue_labels),
+            ('POST', r'/repos/(?P<owner>[^/]+)/(?P<repo>[^/]+)/issues/(?P<number>\d+)/labels', self.add_labels),
+            ('DELETE', r'/repos/(?P<owner>[^/]+)/(?P<repo>[^/]+)/issues/(?P<number>\d+)/labels/(?P<label>[^/]+)',
+             self.remove_label),
+            ('POST', r'/repos/(?P<owner>[^/]+)/(?P<repo>[^/]+)/issues/(?P<number>\d+)/assignees',
+             self.add_assignees),
+            ('DELETE', r'/repos/(?P<owner>[^/]+)/(?P<repo>[^/]+)/issues/(?P<number>\d+)/assignees',
+             self.remove_assignees),
+            ('GET', r'/projects/(?P<id>\d+)', self.get_project),
+            ('GET', r'/projects/(?P<id>\d+)/columns', self.list_columns),
+            ('GET', r'/projects/columns/(?P<id>\d+)/cards', self.list_cards),
+            ('POST', r'/projects/columns/cards/(?P<id>\d+)/moves', self.move_card),
+        ]
+        # Calls are counted by endpoint template, e.g. "GET /repos/{owner}/{repo}/issues/{number}"
+        self.routes = [(verb, re.compile(f'^{pattern}$'), re.sub(r'\(\?P<(\w+)>[^)]+\)', r'{\1}', pattern), handler)
+                       for verb, pattern, handler in self.routes]
+
+    # Seeding
+
+    def next_id(self) -> int:
+        return next(self._ids)
+
+    def reject_next(self, status: int = 403, message: str = 'API rate limit exceeded', headers: dict = None):
+        # The next request is answered with this error instead of being handled
+        self.rejections.append((status, {'message': message}, headers or {}))
+
+    def add_repo(self, full_name: str, labels=('wip', 'ready for review')):
+        self.repos[full_name] = {'labels': set(labels), 'issues': {}}
+
+    def add_issue(self, full_name: str, number: int, state: str = 'open', labels=(), created_at: float = None):
+        self.repos[full_name]['issues'][number] = {
+            'state': state,
+            'labels': list(labels),
+            'assignees': [],
+            'comments': [],
+            'created_at': created_at or time.time(),
+        }
+
+    def add_comment(self, full_name: str, number: int, body: str, login: str = None) -> int:
+        comment_id = self.next_id()
+        now = time.time()
+        self.comments[comment_id] = {'repo': full_name, 'number': number, 'body': body,
+                                     'login': login or self.bot_login, 'created_at': now, 'updated_at': now}
+        self.repos[full_name]['issues'][number]['comments'].append(comment_id)
+        return comment_id
+
+    def add_project(self, project_id: int, name: str, column_names=COLUMN_NAMES) -> dict:
+        columns = {}
+        for column_name in column_names:
+            column_id = self.next_id()
+            self.columns[column_id] = {'name': column_name, 'project': project_id, 'cards': []}
+            columns[column_name] = column_id
+        self.projects[project_id] = {'name': name, 'columns': list(columns.values())}
+        return columns
+
+    def add_card(self, column_id: int, full_name: str, issue_number: int) -> int:
+        card_id = self.next_id()
+        self.cards[card_id] = {'column': column_id,
+                               'content_url': f'{API_URL}/repos/{full_name}/issues/{issue_number}'}
+        self.columns[column_id]['cards'].append(card_id)
+        return card_id
+
+    # requests.Session interface
+
+    def request(self, method, url, headers=None, data=None, **kwargs):
+        headers = headers or {}
+        parsed = urllib.parse.urlparse(url)
+        query = dict(urllib.parse.parse_qsl(parsed.query))
+        body = json.loads(data) if data else None
+        with self._lock:
+            for verb, pattern, endpoint, handler in self.routes:
+                match = pattern.match(parsed.path)
+                if verb == method and match:
+                    self.calls[f'{verb} {endpoint}'] += 1
+                    if self.rejections:
+                        status, payload, extra_headers = self.rejections.popleft()
+                    else:
+                        status, payload, extra_headers = self._call(handler, match.groupdict(), query, body)
+                    break
+            else:
+                self.calls[f'{method} <unknown>'] += 1
+                status, payload, extra_headers = 404, {'message': 'Not Found'}, {}
+            return self._respond(method, status, payload, extra_headers, headers)
+
+    @staticmethod
+    def _call(handler, params, query, body):
+        result = handler(params, query, body)
+        if len(result) == 2:
+            return result + ({},)
+        return result
+
+    def _respond(self, method, status, payload, extra_headers, request_headers):
+        text = json.dumps(payload) if payload is not None else ''
+        headers = {'Content-Type': 'application/json'}
+        headers.update(extra_headers)
+        if method == 'GET' and status == 200:
+            headers['ETag'] = '"%s"' % hashlib.sha1(text.encode('utf-8')).hexdigest()
+        # Like GitHub, a successful conditional request is free
+        if 'ETag' in headers and request_headers.get('If-None-Match') == headers['ETag']:
+            status, text = 304, ''
+        else:
+            self.remaining = max(0, self.remaining - 1)
+        headers.update({
+            'X-RateLimit-Limit': str(self.rate_limit),
+            'X-RateLimit-Remaining': str(self.remaining),
+            'X-RateLimit-Reset': str(self.reset_at),
+        })
+        return FakeResponse(status, headers, text)
+
+    def _paginate(self, items: list, query: dict, path: str):
+        per_page = int(query.get('per_page', 30))
+        page = int(query.get('page', 1))
+        headers = {}
+        if page * per_page < len(items):
+            next_query = dict(query, page=page + 1)
+            headers['Link'] = f'<{API_URL}{path}?{urllib.parse.urlencode(next_query)}>; rel="next"'
+        return 200, items[(page - 1) * per_page:page * per_page], headers
+
+    # Serializers
+
+    def _user(self, login: str) -> dict:
+        return {'login': login, 'id': abs(hash(login)) % 10 ** 8, 'url': f'{API_URL}/users/{login}'}
+
+    def _repo_json(self, full_name: str) -> dict:
+        owner, name = full_name.split('/')
+        return {'full_name': full_name, 'name': name, 'owner': self._user(owner),
+                'url': f'{API_URL}/repos/{full_name}'}
+
+    def _issue_json(self, full_name: str, number: int) -> dict:
+        issue = self.repos[full_name]['issues'][number]
+        return {
+            'number': number,
+            'state': issue['state'],
+            'title': f'Issue {number}',
+            'url': f'{API_URL}/repos/{full_name}/issues/{number}',
+            'labels': [{'name': l} for l in issue['labels']],
+            'assignees': [self._user(a) for a in issue['assignees']],
+            'user': self._user('reporter'),
+            'created_at': iso_timestamp(issue['created_at']),
+        }
+
+    def _comment_json(self, comment_id: int) -> dict:
+        comment = self.comments[comment_id]
+        return {
+            'id': comment_id,
+            'body': comment['body'],
+            'user': self._user(comment['login']),
+            'url': f'{API_URL}/repos/{comment["repo"]}/issues/comments/{comment_id}',
+            'issue_url': f'{API_URL}/repos/{comment["repo"]}/issues/{comment["number"]}',
+            'created_at': iso_timestamp(comment['created_at']),
+            'updated_at': iso_timestamp(comment['updated_at']),
+        }
+
+    def _find_issue(self, params):
+        repo = self.repos.get(f'{params["owner"]}/{params["repo"]}')
+        if not repo or int(params['number']) not in repo['issues']:
+            return None
+        return repo['issues'][int(params['number'])]
+
+    # Handlers
+
+    def get_user(self, params, query, body):
+        return 200, self._user(self.bot_login)
+
+    def get_repo(self, params, query, body):
+        full_name = f'{params["owner"]}/{params["repo"]}'
+        if full_name not in self.repos:
+            return 404, {'message': 'Not Found'}
+        return 200, self._repo_json(full_name)
+
+    def list_repo_labels(self, params, query, body):
+        full_name = f'{params["owner"]}/{params["repo"]}'
+        labels = [{'name': l} for l in sorted(self.repos[full_name]['labels'])]
+        return self._paginate(labels, query, f'/repos/{full_name}/labels')
+
+    def list_issues(self, params, query, body):
+        full_name = f'{params["owner"]}/{params["repo"]}'
+        state = query.get('state', 'open')
+        issues = [self._issue_json(full_name, n) for n, i in sorted(self.repos[full_name]['issues'].items())
+                  if state == 'all' or i['state'] == state]
+        return self._paginate(issues, query, f'/repos/{full_name}/issues')
+
+    def list_repo_comments(self, params, query, body):
+        full_name = f'{params["owner"]}/{params["repo"]}'
+        since = query.get('since')
+        comments = sorted((c for c in self.comments.items() if c[1]['repo'] == full_name),
+                          key=lambda c: (c[1]['updated_at'], c[0]))
+        comments = [self._comment_json(i) for i, c in comments if not since or iso_timestamp(c['updated_at']) >= since]
+        return self._paginate(comments, query, f'/repos/{full_name}/issues/comments')
+
+    def get_comment(self, params, query, body):
+        if int(params['id']) not in self.comments:
+            return 404, {'message': 'Not Found'}
+        return 200, self._comment_json(int(params['id']))
+
+    def edit_comment(self, params, query, body):
+        comment = self.comments[int(params['id'])]
+        comment['body'] = body['body']
+        comment['updated_at'] = time.time()
+        return 200, self._comment_json(int(params['id']))
+
+    def get_issue(self, params, query, body):
+        if not self._find_issue(params):
+            return 404, {'message': 'Not Found'}
+        return 200, self._issue_json(f'{params["owner"]}/{params["repo"]}', int(params['number']))
+
+    def edit_issue(self, params, query, body):
+        issue = self._find_issue(params)
+        issue['state'] = body.get('state', issue['state'])
+        return 200, self._issue_json(f'{params["owner"]}/{params["repo"]}', int(params['number']))
+
+    def list_issue_comments(self, params, query, body):
+        issue = self._find_issue(params)
+        comments = [self._comment_json(i) for i in issue['comments']]
+        return self._paginate(comments, query,
+                              f'/repos/{params["owner"]}/{params["repo"]}/issues/{params["number"]}/comments')
+
+    def create_comment(self, params, query, body):
+        comment_id = self.add_comment(f'{params["owner"]}/{params["repo"]}', int(params['number']), body['body'])
+        return 201, self._comment_json(comment_id)
+
+    def list_issue_labels(self, params, query, body):
+        issue = self._find_issue(params)
+        return self._paginate([{'name': l} for l in issue['labels']], query,
+                              f'/repos/{params["owner"]}/{params["repo"]}/issues/{params["number"]}/labels')
+
+    def add_labels(self, params, query, body):
+        issue = self._find_issue(params)
+        for label in body:
+            self.repos[f'{params["owner"]}/{params["repo"]}']['labels'].add(label)
+            if label not in issue['labels']:
+                issue['labels'].append(label)
+        return 200, [{'name': l} for l in issue['labels']]
+
+    def remove_label(self, params, query, body):
+        issue = self._find_issue(params)
+        label = urllib.parse.unquote(params['label'])
+        if label not in issue['labels']:
+            return 404, {'message': 'Label does not exist'}
+        issue['labels'].remove(label)
+        return 200, [{'name': l} for l in issue['labels']]
+
+    def add_assignees(self, params, query, body):
+        issue = self._find_issue(params)
+        issue['assignees'].extend(a for a in body['assignees'] if a not in issue['assignees'])
+        return 201, self._issue_json(f'{params["owner"]}/{params["repo"]}', int(params['number']))
+
+    def remove_assignees(self, params, query, body):
+        issue = self._find_issue(params)
+        issue['assignees'] = [a for a in issue['assignees'] if a not in body['assignees']]
+        return 200, self._issue_json(f'{params["owner"]}/{params["repo"]}', int(params['number']))
+
+    def get_project(self, params, query, body):
+        project_id = int(params['id'])
+        if project_id not in self.projects:
+            return 404, {'message': 'Not Found'}
+        return 200, {'id': project_id, 'name': self.projects[project_id]['name'],
+                     'url': f'{API_URL}/projects/{project_id}',
+                     'columns_url': f'{API_URL}/projects/{project_id}/columns'}
+
+    def list_columns(self, params, query, body):
+        project_id = int(params['id'])
+        columns = [{'id': c, 'name': self.columns[c]['name'], 'url': f'{API_URL}/projects/columns/{c}',
+                    'cards_url': f'{API_URL}/projects/columns/{c}/cards'}
+                   for c in self.projects[project_id]['columns']]
+        return self._paginate(columns, query, f'/projects/{project_id}/columns')
+
+    def list_cards(self, params, query, body):
+        column_id = int(params['id'])
+        cards = [{'id': c, 'url': f'{API_URL}/projects/columns/cards/{c}',
+                  'content_url': self.cards[c]['content_url'],
+                  'column_url': f'{API_URL}/projects/columns/{column_id}'}
+                 for c in self.columns[column_id]['cards']]
+        return self._paginate(cards, query, f'/projects/columns/{column_id}/cards')
+
+    def move_card(self, params, query, body):
+        card_id, to_column = int(params['id']), int(body['column_id'])
+        card = self.cards[card_id]
+        self.columns[card['column']]['cards'].remove(card_id)
+        self.columns[to_column]['cards'].insert(0, card_id)
+        card['column'] = to_column
+        return 201, {}
+
+    def graphql(self, params, query, body):
+        variables = body.get('variables', {})
+        full_name = f'{variables.get("owner")}/{variables.get("name")}'
+        repository = {}
+        for alias, number in re.findall(r'(\w+): issue\(number: (\d+)\)', body['query']):
+            issue = self.repos.get(full_name, {}).get('issues', {}).get(int(number))
+            if not issue:
+                repository[alias] = None
+                continue
+            comment_ids = issue['comments']
+            repository[alias] = {
+                'number': int(number),
+                'state': issue['state'].upper(),
+                'labels': {'nodes': [{'name': l} for l in issue['labels'][:100]]},
+                'comments': {
+                    'pageInfo': {'hasPreviousPage': len(comment_ids) > 100},
+                    'nodes': [{'databaseId': i, 'body': self.comments[i]['body'],
+                               'author': {'login': self.comments[i]['login']}} for i in comment_ids[-100:]],
+                },
+            }
+        return 200, {'data': {'repository': repository}}
+
+
+class FakeStdout(io.StringIO):
+    # mimic the paramiko ChannelFile returned by exec_command
+
+    class Channel:
+        @staticmethod
+        def recv_exit_status():
+            return 0
+
+        @staticmethod
+        def close():
+            return
+
+    channel = Channel()
+
+
+class FakeGerrit:
+    """Answers ``gerrit query`` commands from a list of change records.
+
+    Stands in for the fabric ``Connection`` used by ``gerrit.run_query``
+    (see ``gerrit.set_connection``), honouring project:, change:, after:,
+    limit: and --start, and counting every command in ``calls``. Events
+    queued in ``events`` are replayed to the next ``gerrit stream-events``
+    subscriber, after which the stream closes.
+    """
+
+    def __init__(self, records: list, events: list = ()):
+        self.records = sorted(records, key=lambda r: r['lastUpdated'], reverse=True)
+        self.events = list(events)
+        self.calls = collections.Counter()
+        self.client = self
+
+    def open(self):
+        return
+
+    def close(self):
+        return
+
+    def exec_command(self, cmd: str):
+        if cmd.startswith('gerrit stream-events'):
+            self.calls['stream-events'] += 1
+            events, self.events = self.events, []
+            return None, FakeStdout(''.join(json.dumps(e) + '\n' for e in events)), io.BytesIO()
+        self.calls['query'] += 1
+        start = int(re.search(r'--start (\d+)', cmd).group(1))
+        limit = int(re.search(r'limit:(\d+)', cmd).group(1))
+        projects = set(re.findall(r'project:([^\s)]+)', cmd))
+        change = re.search(r'change:(\d+)', cmd)
+        after = re.search(r'after:"([^"]+)"', cmd)
+        after = datetime.datetime.strptime(after.group(1), '%Y-%m-%d %H:%M:%S %z').timestamp() if after else None
+
+        matches = [r for r in self.records
+                   if (not projects or r['project'] in projects) and
+                   (not change or r['number'] == int(change.group(1))) and
+                   (after is None or r['lastUpdated'] > after)]
+        page = matches[start:start + limit]
+        lines = [json.dumps(r) for r in page]
+        lines.append(json.dumps({'type': 'stats', 'rowCount': len(page),
+                                 'moreChanges': start + limit < len(matches)}))
+        return None, FakeStdout('\n'.join(lines) + '\n'), io.BytesIO()
+
+
+def generate_dataset(fake_github: FakeGitHub, changes: int, issues: int, cards: int, projects: int = 1,
+                     seed: int = 0) -> (list, list):
+    """Fills ``fake_github`` with issues and boards and returns Gerrit change records and repo mappings.
+
+    Each project gets ``issues`` issues, ``cards`` of which are on its board,
+    and ``changes`` changes tagged with a mix of Relates-To, Closes, legacy
+    and WIP markers.
+    """
+    rng = random.Random(seed)
+    now = int(time.time())
+    records, mappings = [], []
+    for p in range(projects):
+        gerrit_repo, github_repo, project_id = f'sim/project{p}', f'sim-org/project{p}', 1000 + p
+        fake_github.add_repo(github_repo)
+        columns = fake_github.add_project(project_id, f'Project {p}')
+        for number in range(1, issues + 1):
+            fake_github.add_issue(github_repo, number, state='closed' if rng.random() < 0.1 else 'open')
+            if number <= cards:
+                fake_github.add_card(columns[rng.choice(COLUMN_NAMES)], github_repo, number)
+        mappings.append({'gerrit_repo': gerrit_repo, 'github_repo': github_repo, 'github_project_id': project_id})
+
+        for i in range(changes):
+            number = p * changes + i + 1
+            issue = rng.randint(1, issues)
+            style = rng.random()
+            if style < 0.6:
+                footer = f'Relates-To: #{issue}\n'
+            elif style < 0.9:
+                footer = f'Closes: #{issue}\nRelates-To: #{rng.randint(1, issues)}\n'
+            else:
+                footer = ''
+            subject = f'{"WIP: " if rng.random() < 0.2 else ""}Change {number} for component {rng.randint(1, 50)}'
+            if style >= 0.9:
+                subject += f' [#{issue}]'
+            records.append({
+                'project': gerrit_repo,
+                'number': number,
+                'url': f'https://review.example.com/{number}',
+                'subject': subject,
+                'status': 'NEW',
+                'owner': {'name': f'Dev {number % 17}', 'email': f'dev{number % 17}@example.com'},
+                'commitMessage': f'{subject}\n\nSome description of the change.\n\n{footer}'
+                                 f'Change-Id: I{number:040x}\n',
+                'lastUpdated': now - rng.randint(0, 86400 * 30),
+                'currentPatchSet': {
+                    'number': rng.randint(1, 5),
+                    'approvals': [{'type': t, 'value': str(rng.choice((-1, 1, 2))), 'by': {'name': 'Reviewer'}}
+                                  for t in ('Code-Review', 'Verified') if rng.random() < 0.5],
+                    'files': [{'file': f'src/file{n}.py', 'type': 'MODIFIED'} for n in range(rng.randint(1, 10))],
+                },
+            })
+    return records, mappings
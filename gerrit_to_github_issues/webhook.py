@@ -0,0 +1,132 @@
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import hashlib
+import hmac
+import json
+import logging
+import queue
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import github
+
+from gerrit_to_github_issues import github_issues
+from gerrit_to_github_issues import metrics
+
+LOG = logging.getLogger(__name__)
+
+
+def verify_signature(secret: str, body: bytes, signature: str) -> bool:
+    if not signature or not signature.startswith('sha256='):
+        return False
+    expected = hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(f'sha256={expected}', signature)
+
+
+def parse_assign_request(event: str, payload: dict) -> (str, int, int):
+    # Returns (repo, issue number, comment id) for a new /assign comment on an
+    # open issue, or None for anything else
+    if event != 'issue_comment' or payload.get('action') != 'created':
+        return None
+    comment, issue = payload.get('comment') or {}, payload.get('issue') or {}
+    if '/assign' not in (comment.get('body') or '') or issue.get('state') != 'open':
+        return None
+    return payload['repository']['full_name'], issue['number'], comment['id']
+
+
+class WebhookServer:
+    """Receives GitHub ``issue_comment`` webhooks and handles /assign requests.
+
+    Deliveries are authenticated with the webhook secret and queued; a
+    single worker runs the assignment logic for just the commented issue. When
+    the queue is full, GitHub is answered with 503 so it can redeliver later.
+    With ``dry_run`` set, requests are only logged.
+    """
+
+    def __init__(self, gh: github.Github, repo_names: list, secret: str, port: int, host: str = '',
+                 queue_size: int = 100, dry_run: bool = False):
+        self.gh = gh
+        self.repo_names = set(repo_names)
+        self.secret = secret
+        self.dry_run = dry_run
+        self.requests = queue.Queue(maxsize=queue_size)
+        self.httpd = HTTPServer((host, port), self._make_handler())
+        self._repos = {}
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if not verify_signature(server.secret, body, self.headers.get('X-Hub-Signature-256')):
+                    LOG.warning(f'Rejected webhook delivery {self.headers.get("X-GitHub-Delivery")} '
+                                f'with a bad signature')
+                    self.send_response(401)
+                    self.end_headers()
+                    return
+                try:
+                    request = parse_assign_request(self.headers.get('X-GitHub-Event'), json.loads(body))
+                except (ValueError, KeyError, TypeError):
+                    self.send_response(400)
+                    self.end_headers()
+                    return
+                if request and request[0] in server.repo_names:
+                    try:
+                        server.requests.put_nowait(request)
+                    except queue.Full:
+                        LOG.warning(f'Assignment queue is full, dropping request for {request[0]}#{request[1]}')
+                        self.send_response(503)
+                        self.end_headers()
+                        return
+                self.send_response(202)
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                LOG.debug(format % args)
+
+        return Handler
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, name='webhook-server', daemon=True).start()
+        threading.Thread(target=self.work, name='webhook-worker', daemon=True).start()
+        LOG.info(f'Listening for GitHub webhooks on port {self.httpd.server_address[1]}')
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        try:
+            self.requests.put_nowait(None)
+        except queue.Full:
+            # The worker is behind or gone; it is a daemon thread, so don't
+            # hold up shutdown waiting for room in the queue
+            LOG.warning(f'Dropping {self.requests.qsize()} queued assignment requests')
+
+    def work(self):
+        while True:
+            request = self.requests.get()
+            if request is None:
+                return
+            repo_name, issue_number, comment_id = request
+            if self.dry_run:
+                LOG.info(f'Dry run, skipping /assign on {repo_name}#{issue_number} (comment {comment_id})')
+                continue
+            try:
+                with metrics.operation('webhook'):
+                    repo = self._repos.get(repo_name)
+                    if repo is None:
+                        repo = self._repos[repo_name] = self.gh.get_repo(repo_name)
+                    issue = repo.get_issue(issue_number)
+                    github_issues.try_assign(issue, issue.get_comment(comment_id))
+            except Exception:
+                # Keep the only worker alive whatever goes wrong with one request
+                LOG.exception(f'Failed to handle /assign on {repo_name}#{issue_number}')
@@ -0,0 +1,98 @@
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import os
+import random
+
+import pytest
+
+from gerrit_to_github_issues import gerrit
+from gerrit_to_github_issues import github_issues
+from gerrit_to_github_issues import ratelimit
+from gerrit_to_github_issues import simulator
+from tests import helpers
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+CORPUS_SIZE = 100000
+
+# Fragments commit messages are assembled from, including the awkward ones:
+# unclosed brackets, tags without a trailing newline, markers inside words
+# and values, and tags that overlap one another
+SUBJECTS = ('Fix race in {w} handling', 'Add {w} support', 'WIP: Refactor {w}', 'DNM testing {w}',
+            'Handle a[#idx case in {w}', 'Update {w} [#{n}]', '[#{n}] [#{m}] Clean up {w}', 'Bump {w} to 1.{n}',
+            'SWIPE gesture for {w}', 'Revert "{w}" [WIP]', 'Move {w} to org/repo#{n}')
+BODY_LINES = ('Some description of the {w} change.', 'See [docs] for details.', 'Uses the [#{w}] helper',
+              'Follow-up to org/{w}#{n} and {w}/other.repo#{m}', 'Tracked in [#{n}', 'Relates-To: #{n} [#{m}]',
+              'Not ready, WIP until {w} lands.', 'Index a[#i] = b[j]', 'path/to/{w}#{n}', '')
+FOOTERS = ('Relates-To: #{n}', 'Closes: #{n}', 'Relates-To: #{n}, #{m}', 'Relates-To: #{w}', 'Closes: #{n} WIP',
+           'Relates-To: #{n} Closes: #{m}', '[#{n}]', 'Closes: #{n}]', 'Relates-To: #{n}\nCloses: #{m}')
+WORDS = ('parser', 'board', 'gerrit', 'labels', 'DNMS', 'webhook', 'cache', 'io', 'WIPE')
+# Plain description lines, which make up most of a real commit message
+PROSE = ('This reworks how the {w} is built so it no longer depends on the order of the input.',
+         'Previously a failure in the {w} step left the run half done, which was hard to recover from.',
+         'The old behaviour is kept behind a flag for now and will be removed in a later change.',
+         'Tests cover the new code paths, including the empty and the very large cases.')
+
+
+def make_commit_message(rng: random.Random) -> str:
+    def fill(template):
+        return template.format(w=rng.choice(WORDS), n=rng.randint(1, 999), m=rng.randint(1, 999))
+
+    lines = [fill(rng.choice(SUBJECTS)), '']
+    lines.extend(fill(rng.choice(PROSE if rng.random() < 0.7 else BODY_LINES)) for _ in range(rng.randint(2, 10)))
+    lines.append('')
+    lines.extend(fill(rng.choice(FOOTERS)) for _ in range(rng.randint(0, 2)))
+    lines.append(f'Change-Id: I{rng.getrandbits(160):040x}')
+    message = '\n'.join(lines)
+    # Gerrit ends messages with a newline, but hand-written ones may not
+    return message + '\n' if rng.random() < 0.9 else message
+
+
+@pytest.fixture
+def fake_github():
+    return simulator.FakeGitHub(rate_limit=10 ** 9)
+
+
+@pytest.fixture
+def gh(fake_github):
+    return github_issues.get_client(None, None, 'test-token', rate_limiter=ratelimit.RateLimiter(),
+                                    session=fake_github)
+
+
+@pytest.fixture
+def assign_payload() -> bytes:
+    # A recorded issue_comment "created" delivery asking for /assign
+    with open(os.path.join(FIXTURES_DIR, 'issue_comment_created.json'), 'rb') as f:
+        return f.read()
+
+
+@pytest.fixture(scope='session')
+def commit_messages() -> list:
+    rng = random.Random(13)
+    return [make_commit_message(rng) for _ in range(CORPUS_SIZE)]
+
+
+@pytest.fixture
+def board(fake_github) -> dict:
+    # A repo with issue #1 in the Backlog column of its board
+    fake_github.add_repo(helpers.REPO)
+    fake_github.add_issue(helpers.REPO, 1)
+    columns = fake_github.add_project(helpers.PROJECT_ID, 'Board')
+    fake_github.add_card(columns['Backlog'], helpers.REPO, 1)
+    return columns
+
+
+@pytest.fixture
+def fake_gerrit():
+    fake = simulator.FakeGerrit([])
+    gerrit.set_connection(helpers.GERRIT_URL, fake)
+    yield fake
+    gerrit.close_connections()
@@ -0,0 +1,77 @@
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import re
+import time
+
+from gerrit_to_github_issues import github_issues
+from gerrit_to_github_issues import simulator
+
+GERRIT_URL = 'review.example.com'
+REPO = 'o/r'
+PROJECT_ID = 7
+
+LABEL_WRITES = ('POST /repos/{owner}/{repo}/issues/{number}/labels',
+                'DELETE /repos/{owner}/{repo}/issues/{number}/labels/{label}')
+
+
+def legacy_parse_issue_number(commit_msg: str) -> dict:
+    # The three-scan parser parse_commit_message replaced, kept as a reference
+    related = re.findall(r'(?<=Relates-To: #)(.*?)(?=\n)', commit_msg)
+    closes = re.findall(r'(?<=Closes: #)(.*?)(?=\n)', commit_msg)
+    if related or closes:
+        return {
+            'related': github_issues.construct_issue_list(related),
+            'closes': github_issues.construct_issue_list(closes)
+        }
+    legacy_matches = re.findall(r'(?<=\[#)(.*?)(?=\])', commit_msg)
+    if not legacy_matches:
+        return {}
+    return {
+        'related': github_issues.construct_issue_list(legacy_matches)
+    }
+
+
+def legacy_is_wip(commit_msg: str) -> bool:
+    return 'WIP' in commit_msg or 'DNM' in commit_msg
+
+
+def make_record(number: int, project: str, message: str, last_updated: int = None, patch_set: int = 1) -> dict:
+    # A Gerrit query record for FakeGerrit
+    return {
+        'project': project,
+        'number': number,
+        'url': f'https://{GERRIT_URL}/{number}',
+        'subject': message.split('\n', 1)[0],
+        'status': 'NEW',
+        'owner': {'name': 'Dev', 'email': 'dev@example.com'},
+        'commitMessage': message,
+        'lastUpdated': last_updated or int(time.time()) - 60,
+        'currentPatchSet': {'number': patch_set, 'approvals': []},
+    }
+
+
+def set_records(fake_gerrit: simulator.FakeGerrit, records: list):
+    fake_gerrit.records = sorted(records, key=lambda r: r['lastUpdated'], reverse=True)
+
+
+def label_writes(fake_github: simulator.FakeGitHub) -> int:
+    return sum(fake_github.calls[endpoint] for endpoint in LABEL_WRITES)
+
+
+def wait_for(condition, timeout: float = 5.0) -> bool:
+    # Polls until condition() holds, for work done on background threads
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
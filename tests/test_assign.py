@@ -0,0 +1,50 @@
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import time
+
+from gerrit_to_github_issues import checkpoint
+from gerrit_to_github_issues import github_issues
+
+REPO = 'o/r'
+SCOPE = f'{REPO}#assign'
+
+
+def request_assignment(fake_github, number: int, login: str, created_at: int) -> int:
+    comment_id = fake_github.add_comment(REPO, number, '/assign', login=login)
+    fake_github.comments[comment_id].update(created_at=created_at, updated_at=created_at)
+    return comment_id
+
+
+def test_resumes_within_the_cursor_second(gh, fake_github, tmp_path):
+    fake_github.add_repo(REPO)
+    fake_github.add_issue(REPO, 3)
+    fake_github.add_issue(REPO, 4)
+    issues = fake_github.repos[REPO]['issues']
+    repo = gh.get_repo(REPO)
+    store = checkpoint.CheckpointStore(str(tmp_path / 'checkpoint.db'))
+    now = int(time.time())
+    store.set_cursor(SCOPE, now)
+
+    request_assignment(fake_github, 3, 'contributor', now)
+    github_issues.assign_issues(repo, store)
+    assert issues[3]['assignees'] == ['contributor']
+    # since is inclusive, so the cursor stays on the second it last read
+    assert store.get_cursor(SCOPE) == now
+
+    # A request posted later in that same second is still picked up, and the
+    # one already handled is not handled again
+    request_assignment(fake_github, 4, 'other', now)
+    github_issues.assign_issues(repo, store)
+    assert issues[4]['assignees'] == ['other']
+    assert len(issues[3]['comments']) == 2
+    assert issues[3]['assignees'] == ['contributor']
+    store.close()
@@ -0,0 +1,80 @@
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import pytest
+
+from gerrit_to_github_issues import bench
+
+CHANGES = 40
+ISSUES = 15
+CARDS = 10
+
+LABELS = 'POST /repos/{owner}/{repo}/issues/{number}/labels'
+REMOVE_LABEL = 'DELETE /repos/{owner}/{repo}/issues/{number}/labels/{label}'
+MOVE_CARD = 'POST /projects/columns/cards/{id}/moves'
+EDIT_ISSUE = 'PATCH /repos/{owner}/{repo}/issues/{number}'
+GET_COMMENTS = 'GET /repos/{owner}/{repo}/issues/{number}/comments'
+POST_COMMENT = 'POST /repos/{owner}/{repo}/issues/{number}/comments'
+EDIT_COMMENT = 'PATCH /repos/{owner}/{repo}/issues/comments/{id}'
+GRAPHQL = 'POST /graphql'
+WRITES = (LABELS, REMOVE_LABEL, MOVE_CARD, EDIT_ISSUE, POST_COMMENT, EDIT_COMMENT)
+
+# Most calls any single run may make to each endpoint. Each issue is
+# planned once however many changes link to it, so issue writes are
+# bounded by the issue and card counts rather than the change count.
+FIRST_RUN_BUDGET = {
+    LABELS: ISSUES,
+    REMOVE_LABEL: ISSUES,
+    MOVE_CARD: CARDS,
+    EDIT_ISSUE: ISSUES,
+    GET_COMMENTS: 2 * ISSUES,
+    POST_COMMENT: 2 * CHANGES,
+    EDIT_COMMENT: 0,
+    GRAPHQL: 1,
+}
+# Nothing changed between runs, so a resumed run only lists the board and
+# reads the new comments feed
+CHECKPOINT_STEADY_STATE_CALLS = 12
+
+
+def assert_within(calls: dict, budget: dict):
+    over = {endpoint: calls[endpoint] for endpoint, limit in budget.items() if calls.get(endpoint, 0) > limit}
+    assert not over, f'over budget: {over}'
+
+
+@pytest.mark.parametrize('checkpoint', [False, True])
+def test_github_calls_within_budget(checkpoint):
+    first, second, third = bench.run_benchmark(CHANGES, ISSUES, CARDS, runs=3, checkpoint=checkpoint,
+                                                 measure_memory=False)
+
+    assert_within(first['github_calls_by_endpoint'], FIRST_RUN_BUDGET)
+
+    # A second pass over unchanged data must not write anything
+    for steady in (second, third):
+        calls = steady['github_calls_by_endpoint']
+        assert_within(calls, dict(FIRST_RUN_BUDGET, **{endpoint: 0 for endpoint in WRITES}))
+        assert steady['github_calls'] < first['github_calls']
+        if checkpoint:
+            assert GET_COMMENTS not in calls
+            assert steady['github_calls'] <= CHECKPOINT_STEADY_STATE_CALLS
+        else:
+            assert steady['github_calls'] == second['github_calls']
+
+
+def test_memory_measured_in_a_separate_pass():
+    untraced = bench.run_benchmark(CHANGES, ISSUES, CARDS, runs=2, measure_memory=False)
+    traced = bench.run_benchmark(CHANGES, ISSUES, CARDS, runs=2)
+
+    assert all('peak_memory_bytes' not in result for result in untraced)
+    for result, baseline in zip(traced, untraced):
+        # Both passes replay the same dataset, so they make the same calls
+        assert result['github_calls_by_endpoint'] == baseline['github_calls_by_endpoint']
+        assert 0 <= result['retained_memory_bytes'] <= result['peak_memory_bytes']
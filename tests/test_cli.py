@@ -0,0 +1,68 @@
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import sys
+
+import pytest
+
+from gerrit_to_github_issues import cli
+
+CONFIG = '''
+gerrit_url: review.example.com
+workers: 8
+cache_size: 50
+mappings:
+  - gerrit_repo: g/a
+    github_repo: o/r
+    github_project_id: 7
+'''
+
+
+@pytest.fixture
+def config_file(tmp_path) -> str:
+    path = tmp_path / 'config.yaml'
+    path.write_text(CONFIG)
+    return str(path)
+
+
+def parse(argv: list) -> (dict, set):
+    parser = cli.make_parser()
+    ns = parser.parse_args(argv)
+    return vars(ns), cli.get_explicit_args(parser, ns, argv)
+
+
+def test_command_line_flags_win_over_config(config_file):
+    args, explicit_args = parse(['--config', config_file, '--workers', '1', '-g', 'other.example.com'])
+    assert {'workers', 'gerrit_url', 'config'} <= explicit_args
+    assert 'cache_size' not in explicit_args
+
+    mappings = cli.get_mappings(args.pop('config'), args, explicit_args)
+    assert mappings == [{'gerrit_repo': 'g/a', 'github_repo': 'o/r', 'github_project_id': 7}]
+    # Given on the command line, even with the default value
+    assert args['workers'] == 1
+    assert args['gerrit_url'] == 'other.example.com'
+    # Left at its default, so the config file sets it
+    assert args['cache_size'] == 50
+
+
+@pytest.mark.parametrize('argv, message', [
+    (['--config', 'config.yaml', 'g/a', 'o/r', '7'], 'cannot be used with --config'),
+    (['g/a', 'o/r'], 'are required without --config'),
+    (['--metrics-port', '9100', 'g/a', 'o/r', '7'], '--metrics-port requires --serve'),
+    (['--webhook-port', '8080', 'g/a', 'o/r', '7'], '--webhook-port requires --serve'),
+])
+def test_usage_errors(monkeypatch, capsys, argv, message):
+    monkeypatch.setattr(sys, 'argv', ['gerrit-to-github-issues'] + argv)
+    monkeypatch.delenv('GERRIT_TO_GITHUB_CONFIG', raising=False)
+    with pytest.raises(SystemExit) as e:
+        cli.main()
+    assert e.value.code == 2
+    assert message in capsys.readouterr().err
@@ -0,0 +1,70 @@
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import logging
+
+import pytest
+
+from gerrit_to_github_issues import github_issues
+from tests import helpers
+
+
+def non_empty(issue_numbers: dict) -> dict:
+    # The old parser returned empty lists for tags that failed to parse
+    return {k: v for k, v in issue_numbers.items() if v}
+
+
+@pytest.fixture(autouse=True)
+def quiet_parse_warnings(caplog):
+    caplog.set_level(logging.ERROR, logger=github_issues.LOG.name)
+
+
+@pytest.mark.parametrize('message, expected, wip', [
+    ('Fix the thing\n\nRelates-To: #12\nChange-Id: I1\n', {'related': [12], 'closes': []}, False),
+    ('Fix the thing\n\nCloses: #7\nRelates-To: #8\n', {'related': [8], 'closes': [7]}, False),
+    ('[#3] Legacy style\n\nChange-Id: I1\n', {'related': [3]}, False),
+    ('[#3] Legacy style\n\nRelates-To: #4\n', {'related': [4], 'closes': []}, False),
+    ('WIP: Not yet\n\nRelates-To: #1\n', {'related': [1], 'closes': []}, True),
+    ('Not yet\n\nRelates-To: #1 DNM\n', {'related': [], 'closes': []}, True),
+    ('Relates-To: #5', {}, False),
+    # A "[#" with no closing bracket on its line must not swallow later tags
+    ('Handle a[#idx case\n\nRelates-To: #5\nSee [docs]\n', {'related': [5], 'closes': []}, False),
+    ('Tracked in [#9\nand more]\n', {}, False),
+    # Overlapping tags are each seen, as with separate scans
+    ('Fix\n\nRelates-To: #5 Closes: #6\n', {'related': [], 'closes': [6]}, False),
+    ('Fix [#1 [#2]\n', {'related': []}, False),
+    ('Move to sim/WIP-tools#3\n', {}, True),
+])
+def test_parse_commit_message(message, expected, wip):
+    tags = github_issues.parse_commit_message(message)
+    assert non_empty(tags.issue_numbers()) == non_empty(expected)
+    assert tags.wip is wip
+    assert helpers.legacy_parse_issue_number(message) == expected
+    assert helpers.legacy_is_wip(message) is wip
+
+
+def test_cross_repo_references():
+    tags = github_issues.parse_commit_message('See airshipit/airshipctl#12 and a/b#x and /c#3\n')
+    assert tags.cross_repo == [('airshipit/airshipctl', 12)]
+    tags = github_issues.parse_commit_message('Moved from a/b/c#3 [#4]\n\nRelates-To: #5\n')
+    assert tags.cross_repo == [('b/c', 3)]
+    assert tags.issue_numbers() == {'related': [5], 'closes': []}
+    assert github_issues.parse_commit_message('Issue #3 and x#y\n').cross_repo == []
+
+
+def test_matches_legacy_parser(commit_messages):
+    mismatches = []
+    for message in commit_messages:
+        tags = github_issues.parse_commit_message(message)
+        if non_empty(tags.issue_numbers()) != non_empty(helpers.legacy_parse_issue_number(message)) or \
+                tags.wip != helpers.legacy_is_wip(message):
+            mismatches.append(message)
+    assert not mismatches, f'{len(mismatches)} messages differ, e.g. {mismatches[0]!r}'
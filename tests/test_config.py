@@ -0,0 +1,45 @@
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import pytest
+
+from gerrit_to_github_issues import config
+from gerrit_to_github_issues import errors
+
+MAPPING = '''
+mappings:
+  - gerrit_repo: airship/airshipctl
+    github_repo: airshipit/airshipctl
+    github_project_id: 1234
+'''
+
+
+def write_config(tmp_path, text: str) -> str:
+    path = tmp_path / 'config.yaml'
+    path.write_text(text + MAPPING)
+    return str(path)
+
+
+def test_integer_settings_converted(tmp_path):
+    settings = config.load_config(write_config(tmp_path, 'gerrit_port: "29419"\nworkers: 8\ncache_size: 50\n'))
+    assert (settings['gerrit_port'], settings['workers'], settings['cache_size']) == (29419, 8, 50)
+    assert settings['mappings'][0]['github_project_id'] == 1234
+
+
+@pytest.mark.parametrize('text, message', [
+    ('workers: eight\n', "workers in .* must be an integer, got 'eight'"),
+    ('cache_size: [1]\n', 'cache_size in .* must be an integer'),
+    ('gerrit_port: null\n', 'gerrit_port in .* must be an integer, got None'),
+    ('workers: 0\n', 'workers in .* must be positive, got 0'),
+])
+def test_invalid_integer_settings(tmp_path, text, message):
+    with pytest.raises(errors.ConfigFileError, match=message):
+        config.load_config(write_config(tmp_path, text))
@@ -0,0 +1,162 @@
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import threading
+import time
+
+import pytest
+
+from gerrit_to_github_issues import checkpoint
+from gerrit_to_github_issues import daemon
+from gerrit_to_github_issues import engine
+from gerrit_to_github_issues import gerrit
+from gerrit_to_github_issues import planner
+from tests.helpers import GERRIT_URL, PROJECT_ID, REPO, label_writes, make_record, set_records, wait_for
+
+MAPPINGS = [{'gerrit_repo': 'g/a', 'github_repo': REPO, 'github_project_id': PROJECT_ID}]
+DEBOUNCE = 0.05
+
+
+def make_event(change_number: int, created_on: int, event_type: str = 'patchset-created',
+               project: str = 'g/a') -> dict:
+    return {'type': event_type, 'change': {'project': project, 'number': str(change_number)},
+            'eventCreatedOn': created_on}
+
+
+@pytest.fixture
+def make_daemon(gh, fake_gerrit, board):
+    daemons = []
+
+    def make(**kwargs) -> daemon.Daemon:
+        d = daemon.Daemon(GERRIT_URL, gh, MAPPINGS, debounce=DEBOUNCE, **kwargs)
+        daemons.append(d)
+        return d
+
+    yield make
+    for d in daemons:
+        d.stop()
+        if d.store:
+            d.store.close()
+
+
+def start(target) -> threading.Thread:
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    return thread
+
+
+def gerrit_change(fake_gerrit, number: int) -> gerrit.Change:
+    return gerrit.make_change(next(r for r in fake_gerrit.records if r['number'] == number))
+
+
+def bot_comments(fake_github) -> int:
+    return len(fake_github.repos[REPO]['issues'][1]['comments'])
+
+
+def test_events_for_a_change_are_coalesced(fake_github, fake_gerrit, make_daemon):
+    now = int(time.time())
+    set_records(fake_gerrit, [make_record(10, 'g/a', 'Ready change\n\nRelates-To: #1\n', now)])
+    d = make_daemon()
+    for offset, event_type in enumerate(('patchset-created', 'comment-added', 'comment-added')):
+        d.handle_event(make_event(10, now + offset, event_type))
+    # Ignored: an unmapped project and an event type that never changes an issue
+    d.handle_event(make_event(11, now, project='g/other'))
+    d.handle_event(make_event(10, now, event_type='ref-updated'))
+    assert list(d._pending) == [10]
+    assert d.last_event == now + 2
+
+    start(d.dispatch)
+    assert wait_for(lambda: bot_comments(fake_github) == 1)
+    time.sleep(DEBOUNCE * 4)
+    assert fake_gerrit.calls['query'] == 1
+    assert bot_comments(fake_github) == 1
+
+
+def test_issue_planned_against_every_linked_change(gh, fake_github, fake_gerrit, make_daemon, tmp_path):
+    checkpoint_db = str(tmp_path / 'checkpoint.db')
+    now = int(time.time())
+    ready = make_record(10, 'g/a', 'Ready change\n\nRelates-To: #1\n', now - 100)
+    wip = make_record(11, 'g/a', 'WIP: not yet\n\nRelates-To: #1\n', now - 100)
+    set_records(fake_gerrit, [ready, wip])
+    engine.sync(gh, GERRIT_URL, MAPPINGS, checkpoint_db=checkpoint_db)
+    issue = fake_github.repos[REPO]['issues'][1]
+    assert issue['labels'] == [planner.REVIEW_LABEL]
+
+    # A new patch set on the WIP change leaves the issue ready for review,
+    # since the other linked change still is
+    set_records(fake_gerrit, [ready, make_record(11, 'g/a', wip['commitMessage'], now, patch_set=2)])
+    d = make_daemon(checkpoint_db=checkpoint_db)
+    fake_github.calls.clear()
+    d.handle_event(make_event(11, now))
+    start(d.dispatch)
+    assert wait_for(lambda: d.store.get_cursor(d.scope) == now)
+    assert issue['labels'] == [planner.REVIEW_LABEL]
+    assert label_writes(fake_github) == 0
+
+
+def test_cursor_held_after_a_failed_change(fake_github, fake_gerrit, make_daemon, tmp_path, monkeypatch):
+    now = int(time.time())
+    set_records(fake_gerrit, [make_record(10, 'g/a', 'Ready change\n\nRelates-To: #1\n', now),
+                              make_record(11, 'g/a', 'Other change\n\nRelates-To: #1\n', now)])
+    d = make_daemon(checkpoint_db=str(tmp_path / 'checkpoint.db'))
+    process_issue = engine.process_issue
+
+    def failing_process_issue(ctx, issue_number, links, is_wip=None):
+        if any(change.number == 10 for change, _ in links):
+            raise RuntimeError('GitHub is down')
+        return process_issue(ctx, issue_number, links, is_wip)
+
+    monkeypatch.setattr(engine, 'process_issue', failing_process_issue)
+    start(d.dispatch)
+    d.handle_event(make_event(10, now))
+    assert wait_for(lambda: d.cursor_blocked)
+    assert d.store.get_cursor(d.scope) is None
+
+    # Later changes still sync, but the cursor stays put so a restart's
+    # backfill retries the failed change
+    d.handle_event(make_event(11, now + 1))
+    assert wait_for(lambda: bot_comments(fake_github) == 1)
+    time.sleep(DEBOUNCE * 4)
+    assert d.store.get_cursor(d.scope) is None
+    scope = f'{GERRIT_URL}/g/a'
+    assert not d.store.is_unchanged(scope, 10, checkpoint.change_fingerprint(gerrit_change(fake_gerrit, 10)))
+
+
+def test_cursor_never_passes_a_waiting_change(make_daemon, tmp_path):
+    d = make_daemon(checkpoint_db=str(tmp_path / 'checkpoint.db'))
+    d.advance_cursor([[]], 1000, [990])
+    assert d.store.get_cursor(d.scope) == 989
+    d.advance_cursor([[]], 1000, [])
+    assert d.store.get_cursor(d.scope) == 1000
+    d.advance_cursor([None], 1010, [])
+    assert d.cursor_blocked
+    assert d.store.get_cursor(d.scope) == 1000
+
+
+def test_reconnect_backfills_from_last_event(gh, fake_gerrit, make_daemon, tmp_path):
+    checkpoint_db = str(tmp_path / 'checkpoint.db')
+    now = int(time.time())
+    store = checkpoint.CheckpointStore(checkpoint_db)
+    store.set_cursor(f'{GERRIT_URL}#stream-events', now - 50)
+    store.close()
+    set_records(fake_gerrit, [make_record(12, 'g/a', 'Missed change\n\nRelates-To: #1\n', now - 10),
+                              make_record(13, 'g/a', 'Old change\n\nRelates-To: #1\n', now - 100)])
+    fake_gerrit.events = [make_event(14, now)]
+
+    d = make_daemon(checkpoint_db=checkpoint_db)
+    assert d.last_event == now - 50
+    start(d.listen)
+    # The change updated while disconnected is backfilled next to the
+    # streamed one, and the one the cursor already covers is not
+    assert wait_for(lambda: {12, 14} <= set(d._pending))
+    assert 13 not in d._pending
+    assert d.last_event == now
+    assert fake_gerrit.calls['stream-events'] == 1
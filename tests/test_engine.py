@@ -0,0 +1,92 @@
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import time
+
+from gerrit_to_github_issues import engine
+from gerrit_to_github_issues import gerrit
+from gerrit_to_github_issues import planner
+from tests.helpers import GERRIT_URL, PROJECT_ID, REPO, label_writes, make_record, set_records
+
+def test_gerrit_repos_sharing_a_github_repo_plan_issues_together(gh, fake_github, fake_gerrit, board):
+    mappings = [{'gerrit_repo': project, 'github_repo': REPO, 'github_project_id': PROJECT_ID}
+                for project in ('g/a', 'g/b')]
+    set_records(fake_gerrit, [make_record(10, 'g/a', 'Ready change\n\nRelates-To: #1\n'),
+                              make_record(11, 'g/b', 'WIP: not yet\n\nRelates-To: #1\n')])
+
+    contexts = engine.build_contexts(gh, mappings)
+    assert contexts['g/a'] is contexts['g/b']
+    assert fake_github.calls['GET /projects/{id}/columns'] == 1
+
+    for _ in range(3):
+        fake_github.calls.clear()
+        engine.sync(gh, GERRIT_URL, mappings)
+        assert fake_github.repos[REPO]['issues'][1]['labels'] == [planner.REVIEW_LABEL]
+    assert label_writes(fake_github) == 0
+
+
+def test_changes_are_processed_while_the_query_is_read(gh, fake_github, board, monkeypatch):
+    monkeypatch.setattr(engine, 'PREFETCH_BATCH_SIZE', 1)
+    fake_github.add_issue(REPO, 2)
+    posted = []
+
+    def get_changes(*args, **kwargs):
+        yield gerrit.make_change(make_record(10, 'g/a', 'First\n\nRelates-To: #1\n'))
+        posted.append(len(fake_github.repos[REPO]['issues'][1]['comments']))
+        yield gerrit.make_change(make_record(11, 'g/a', 'Second\n\nRelates-To: #2\n'))
+
+    monkeypatch.setattr(gerrit, 'get_changes', get_changes)
+    engine.sync(gh, GERRIT_URL, [{'gerrit_repo': 'g/a', 'github_repo': REPO, 'github_project_id': PROJECT_ID}])
+    # The first change's comment went out before the second change was read
+    assert posted == [1]
+    assert len(fake_github.repos[REPO]['issues'][2]['comments']) == 1
+
+
+def test_issue_state_waits_for_every_linked_change(gh, fake_github, fake_gerrit, board, monkeypatch):
+    monkeypatch.setattr(engine, 'PREFETCH_BATCH_SIZE', 1)
+    mappings = [{'gerrit_repo': 'g/a', 'github_repo': REPO, 'github_project_id': PROJECT_ID}]
+    now = int(time.time())
+    # Gerrit returns the newest change first, so the WIP change is seen in
+    # an earlier batch than the ready one
+    set_records(fake_gerrit, [make_record(10, 'g/a', 'WIP: not yet\n\nRelates-To: #1\n', now - 10),
+                              make_record(11, 'g/a', 'Ready change\n\nRelates-To: #1\n', now - 20)])
+
+    engine.sync(gh, GERRIT_URL, mappings)
+    issue = fake_github.repos[REPO]['issues'][1]
+    assert issue['labels'] == [planner.REVIEW_LABEL]
+    assert len(issue['comments']) == 2
+    assert label_writes(fake_github) == 1
+
+
+def test_checkpointed_runs_plan_against_unchanged_changes(gh, fake_github, fake_gerrit, board, tmp_path):
+    mappings = [{'gerrit_repo': 'g/a', 'github_repo': REPO, 'github_project_id': PROJECT_ID}]
+    checkpoint_db = str(tmp_path / 'checkpoint.db')
+    now = int(time.time())
+    ready = make_record(10, 'g/a', 'Ready change\n\nRelates-To: #1\n', now - 100)
+    wip = make_record(11, 'g/a', 'WIP: not yet\n\nRelates-To: #1\n', now - 100)
+    set_records(fake_gerrit, [ready, wip])
+    engine.sync(gh, GERRIT_URL, mappings, checkpoint_db=checkpoint_db)
+    issue = fake_github.repos[REPO]['issues'][1]
+    assert issue['labels'] == [planner.REVIEW_LABEL]
+
+    # Only the WIP change moves on, so the ready one is skipped
+    set_records(fake_gerrit, [ready, dict(wip, lastUpdated=now, currentPatchSet={'number': 2, 'approvals': []})])
+    fake_github.calls.clear()
+    engine.sync(gh, GERRIT_URL, mappings, checkpoint_db=checkpoint_db)
+    assert issue['labels'] == [planner.REVIEW_LABEL]
+    engine.sync(gh, GERRIT_URL, mappings)
+    assert issue['labels'] == [planner.REVIEW_LABEL]
+    assert label_writes(fake_github) == 0
+
+    # Once the ready change stops referring to the issue, it follows the WIP one
+    set_records(fake_gerrit, [dict(ready, lastUpdated=now, commitMessage='Ready change\n'), wip])
+    engine.sync(gh, GERRIT_URL, mappings, checkpoint_db=checkpoint_db)
+    assert issue['labels'] == [planner.WIP_LABEL]
@@ -0,0 +1,154 @@
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import json
+import os
+import time
+
+import pytest
+
+from gerrit_to_github_issues import github_http
+from gerrit_to_github_issues import ratelimit
+from gerrit_to_github_issues import simulator
+
+REPO = 'o/r'
+GET_REPO = 'GET /repos/{owner}/{repo}'
+HEADERS = {'Authorization': 'token test-token', 'Accept': 'application/vnd.github.v3+json'}
+
+
+@pytest.fixture
+def fake_github():
+    fake = simulator.FakeGitHub(rate_limit=5000)
+    fake.add_repo(REPO)
+    return fake
+
+
+@pytest.fixture
+def sleeps(monkeypatch) -> list:
+    # Record the rate limiter's waits instead of sleeping through them
+    delays = []
+    monkeypatch.setattr(ratelimit.time, 'sleep', delays.append)
+    return delays
+
+
+def get(connection_class, url: str):
+    conn = connection_class('api.github.com')
+    conn.request('GET', url, None, dict(HEADERS))
+    return conn.getresponse()
+
+
+def test_not_modified_served_from_cache(fake_github, tmp_path):
+    limiter = ratelimit.RateLimiter()
+    cache = github_http.ResponseCache(str(tmp_path))
+    connection_class = github_http.make_connection_class(limiter, cache=cache, session=fake_github)
+
+    first = get(connection_class, f'/repos/{REPO}')
+    assert first.status == 200
+    assert os.listdir(tmp_path) == [cache.key(f'/repos/{REPO}', HEADERS)]
+
+    # Other requests use up the budget in between
+    fake_github.remaining = 42
+    second = get(connection_class, f'/repos/{REPO}')
+    assert second.status == 200
+    assert json.loads(second.read()) == json.loads(first.read())
+    headers = dict(second.getheaders())
+    assert headers['ETag'] == dict(first.getheaders())['ETag']
+    assert headers['X-RateLimit-Remaining'] == '42'
+    assert limiter.remaining == 42
+    # The conditional request did not count against the rate limit
+    assert fake_github.remaining == 42
+    assert fake_github.calls[GET_REPO] == 2
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    entry = {'etag': '"x"', 'status': 200, 'headers': {}, 'body': 'x' * 1000}
+    size = len(json.dumps(entry))
+    cache = github_http.ResponseCache(str(tmp_path), max_bytes=int(size * 2.5))
+    cache.put('a', entry)
+    cache.put('b', entry)
+    os.utime(tmp_path / 'a', (1, 1))
+    os.utime(tmp_path / 'b', (2, 2))
+    # Reading an entry makes it the most recently used
+    assert cache.get('a') == entry
+
+    cache.put('c', entry)
+    assert sorted(os.listdir(tmp_path)) == ['a', 'c']
+    assert cache.size == 2 * size <= cache.max_bytes
+    assert cache.get('b') is None
+    # The size is picked up again from the directory
+    assert github_http.ResponseCache(str(tmp_path)).size == cache.size
+
+
+@pytest.mark.parametrize('message, headers, delay', [
+    ('You have exceeded a secondary rate limit', {}, ratelimit.SECONDARY_LIMIT_DELAY),
+    ('API rate limit exceeded', {'Retry-After': '7'}, 7),
+])
+def test_rate_limited_request_retried(fake_github, sleeps, message, headers, delay):
+    limiter = ratelimit.RateLimiter()
+    connection_class = github_http.make_connection_class(limiter, session=fake_github)
+    fake_github.reject_next(message=message, headers=headers)
+
+    r = get(connection_class, f'/repos/{REPO}')
+    assert r.status == 200
+    assert json.loads(r.read())['full_name'] == REPO
+    assert fake_github.calls[GET_REPO] == 2
+    assert len(sleeps) == 1
+    assert delay - 1 <= sleeps[0] <= delay
+
+
+def test_retries_give_up(fake_github, sleeps):
+    limiter = ratelimit.RateLimiter()
+    connection_class = github_http.make_connection_class(limiter, session=fake_github)
+    for _ in range(github_http.MAX_RATE_LIMIT_RETRIES + 1):
+        fake_github.reject_next(headers={'Retry-After': '1'})
+
+    assert get(connection_class, f'/repos/{REPO}').status == 403
+    assert fake_github.calls[GET_REPO] == github_http.MAX_RATE_LIMIT_RETRIES + 1
+
+
+def test_forbidden_not_retried(fake_github, sleeps):
+    limiter = ratelimit.RateLimiter()
+    connection_class = github_http.make_connection_class(limiter, session=fake_github)
+    fake_github.reject_next(message='Resource not accessible by integration')
+
+    assert get(connection_class, f'/repos/{REPO}').status == 403
+    assert fake_github.calls[GET_REPO] == 1
+    assert sleeps == []
+
+
+def test_acquire_blocks_at_reserve(fake_github, sleeps):
+    limiter = ratelimit.RateLimiter(reserve=5, pace_below=0)
+    connection_class = github_http.make_connection_class(limiter, session=fake_github)
+    fake_github.remaining = 7
+
+    # Above the reserve, requests go straight through
+    get(connection_class, f'/repos/{REPO}')
+    get(connection_class, f'/repos/{REPO}')
+    assert limiter.remaining == 5
+    assert sleeps == []
+
+    # At the reserve, the next request waits for the window to reset
+    get(connection_class, f'/repos/{REPO}')
+    assert len(sleeps) == 1
+    assert fake_github.reset_at - time.time() - 1 <= sleeps[0] <= fake_github.reset_at - time.time() + 1
+    assert fake_github.calls[GET_REPO] == 3
+
+
+def test_acquire_paces_near_the_limit(sleeps):
+    limiter = ratelimit.RateLimiter(reserve=10, pace_below=0.1)
+    now = time.time()
+    limiter.update({'X-RateLimit-Remaining': '110', 'X-RateLimit-Limit': '5000',
+                    'X-RateLimit-Reset': str(int(now) + 100)})
+    limiter.acquire()
+    # The rest of the window is spread over the requests left above the reserve
+    assert len(sleeps) == 1
+    assert 0.9 <= sleeps[0] <= 1.0
+    assert limiter.remaining == 109
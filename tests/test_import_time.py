@@ -0,0 +1,40 @@
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import subprocess
+import sys
+
+# Generous next to the ~10ms the CLI takes to import without its heavy
+# dependencies, which alone add a quarter of a second or more
+IMPORT_BUDGET_US = 150000
+HEAVY_MODULES = ('github', 'fabric', 'paramiko', 'yaml')
+
+
+def import_cli() -> (set, int):
+    # A fresh interpreter, since this one has likely imported everything
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c',
+         'import sys; import gerrit_to_github_issues.cli; print(" ".join(sys.modules))'],
+        capture_output=True, text=True, check=True)
+    cumulative = None
+    for line in result.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        fields = [f.strip() for f in line.split(':', 1)[-1].split('|')]
+        if len(fields) == 3 and fields[2] == 'gerrit_to_github_issues.cli':
+            cumulative = int(fields[1])
+    return set(result.stdout.split()), cumulative
+
+
+def test_cli_import_is_light():
+    modules, cumulative = import_cli()
+    assert not modules.intersection(HEAVY_MODULES)
+    assert cumulative is not None
+    assert cumulative < IMPORT_BUDGET_US, f'importing the CLI took {cumulative}us'
@@ -0,0 +1,63 @@
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import logging
+import timeit
+
+import pytest
+
+from gerrit_to_github_issues import github_issues
+from tests import helpers
+
+pytest.importorskip('pytest_benchmark')
+
+# How much faster than the three-scan parser the single pass must be over
+# the corpus. It runs well over twice as fast, while a pass that tries every
+# tag at every position only manages about 1.7 times.
+MIN_SPEEDUP = 2.0
+ROUNDS = 5
+
+
+@pytest.fixture(autouse=True)
+def quiet_parse_warnings(caplog):
+    caplog.set_level(logging.ERROR, logger=github_issues.LOG.name)
+
+
+def parse_all(messages: list):
+    for message in messages:
+        github_issues.parse_commit_message(message)
+
+
+def legacy_parse_all(messages: list):
+    for message in messages:
+        helpers.legacy_parse_issue_number(message)
+        helpers.legacy_is_wip(message)
+
+
+@pytest.mark.benchmark(group='parse-commit-message')
+def test_parse_commit_message_benchmark(benchmark, commit_messages):
+    benchmark.pedantic(parse_all, args=(commit_messages,), rounds=3, iterations=1)
+
+
+@pytest.mark.benchmark(group='parse-commit-message')
+def test_legacy_parser_benchmark(benchmark, commit_messages):
+    benchmark.pedantic(legacy_parse_all, args=(commit_messages,), rounds=3, iterations=1)
+
+
+def test_faster_than_legacy_parser(commit_messages):
+    # Timed here rather than with the benchmark fixture so the check still
+    # runs with --benchmark-disable. The two parsers take turns so a slow
+    # patch on a busy machine hits both, and the best round of each counts.
+    new, old = [], []
+    for _ in range(ROUNDS):
+        new.append(timeit.timeit(lambda: parse_all(commit_messages), number=1))
+        old.append(timeit.timeit(lambda: legacy_parse_all(commit_messages), number=1))
+    assert min(old) / min(new) >= MIN_SPEEDUP, f'single pass took {min(new):.3f}s, three scans {min(old):.3f}s'
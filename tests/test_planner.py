@@ -0,0 +1,54 @@
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from gerrit_to_github_issues import planner
+
+COLUMNS = ('Backlog', planner.WIP_COLUMN, planner.REVIEW_COLUMN, 'Done')
+BODY = '## Related Change [#10](https://review.example.com/10)\n\n*Last Updated: 2020-01-01 00:00:00 CST*'
+
+
+def test_moves_card_to_target_column():
+    plan = planner.plan_issue(1, 'open', {planner.REVIEW_LABEL}, 'Backlog', COLUMNS, False, [])
+    assert plan.column == planner.REVIEW_COLUMN
+    assert not plan.add_labels and not plan.remove_labels
+
+
+def test_no_move_without_card_or_column():
+    labels = {planner.WIP_LABEL}
+    assert planner.plan_issue(1, 'open', labels, None, COLUMNS, True, []).is_noop()
+    assert planner.plan_issue(1, 'open', labels, 'Backlog', ('Backlog', 'Done'), True, []).is_noop()
+
+
+def test_labels_follow_combined_state():
+    plan = planner.plan_issue(1, 'open', {planner.WIP_LABEL}, planner.REVIEW_COLUMN, COLUMNS, False, [])
+    assert plan.add_labels == [planner.REVIEW_LABEL]
+    assert plan.remove_labels == [planner.WIP_LABEL]
+
+
+def test_state_left_alone_without_is_wip():
+    plan = planner.plan_issue(1, 'open', set(), 'Backlog', COLUMNS, None, [(None, None, BODY, 'related')])
+    assert not plan.add_labels and not plan.column
+    assert plan.comments == [(None, BODY)]
+
+
+def test_only_volatile_comment_changes_are_skipped():
+    fresh = BODY.replace('2020-01-01', '2020-02-02')
+    assert planner.plan_issue(1, 'open', set(), None, COLUMNS, None, [(5, BODY, fresh, 'related')]).is_noop()
+    edited = fresh.replace('#10', '#10 edited')
+    assert planner.plan_issue(1, 'open', set(), None, COLUMNS, None,
+                              [(5, BODY, edited, 'related')]).comments == [(5, edited)]
+
+
+def test_closed_issue_reopened_for_new_comment():
+    plan = planner.plan_issue(1, 'closed', set(), None, COLUMNS, None, [(None, None, BODY, 'closes')])
+    assert plan.reopen
+    assert plan.comments == [(None, BODY + planner.CLOSES_SUFFIX)]
+    assert not planner.plan_issue(1, 'closed', set(), None, COLUMNS, None, [(5, BODY, BODY, 'related')]).reopen
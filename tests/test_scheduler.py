@@ -0,0 +1,79 @@
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import collections
+import threading
+import time
+
+import pytest
+
+from gerrit_to_github_issues import scheduler
+
+KEYS = ('a', 'b', 'c')
+TASKS_PER_KEY = 20
+
+
+def test_same_key_tasks_run_in_order_one_at_a_time():
+    s = scheduler.KeyedScheduler(workers=4)
+    lock = threading.Lock()
+    running = collections.Counter()
+    overlaps = []
+    order = collections.defaultdict(list)
+    # The first task of every key waits for the others, which only works if
+    # different keys run concurrently
+    started = threading.Barrier(len(KEYS), timeout=5)
+
+    def task(key, i):
+        with lock:
+            running[key] += 1
+            if running[key] > 1:
+                overlaps.append((key, i))
+        if i == 0:
+            started.wait()
+        time.sleep(0.001)
+        with lock:
+            order[key].append(i)
+            running[key] -= 1
+        return key, i
+
+    futures = [s.submit(key, task, key, i) for i in range(TASKS_PER_KEY) for key in KEYS]
+    s.shutdown()
+
+    assert overlaps == []
+    assert order == {key: list(range(TASKS_PER_KEY)) for key in KEYS}
+    assert [f.result() for f in futures] == [(key, i) for i in range(TASKS_PER_KEY) for key in KEYS]
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_shutdown_raises_first_failure(workers):
+    s = scheduler.KeyedScheduler(workers=workers)
+    ran = []
+
+    def task(key, i):
+        if key == 'b' and i == 1:
+            raise ValueError('task failed')
+        ran.append((key, i))
+
+    futures = [s.submit(key, task, key, i) for i in range(3) for key in KEYS]
+    with pytest.raises(ValueError, match='task failed'):
+        s.shutdown()
+
+    # A failure does not stop later tasks, on its own key or any other
+    assert sorted(ran) == sorted((key, i) for i in range(3) for key in KEYS if (key, i) != ('b', 1))
+    assert isinstance(futures[4].exception(), ValueError)
+    assert all(f.done() for f in futures)
+
+
+def test_shutdown_without_failures():
+    s = scheduler.KeyedScheduler(workers=2)
+    futures = [s.submit(i % 2, pow, i, 2) for i in range(10)]
+    s.shutdown()
+    assert [f.result() for f in futures] == [i ** 2 for i in range(10)]
@@ -0,0 +1,171 @@
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import hashlib
+import hmac
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+import requests
+
+from gerrit_to_github_issues import webhook
+
+SECRET = 'webhook-secret'
+REPO = 'sim-org/project0'
+
+
+def sign(body: bytes, secret: str = SECRET) -> str:
+    return 'sha256=' + hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+
+
+def deliver(server: webhook.WebhookServer, body: bytes, signature: str, event: str = 'issue_comment') -> int:
+    request = urllib.request.Request(f'http://127.0.0.1:{server.httpd.server_address[1]}/', data=body, headers={
+        'X-GitHub-Event': event,
+        'X-GitHub-Delivery': 'test-delivery',
+        'X-Hub-Signature-256': signature,
+        'Content-Type': 'application/json',
+    })
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+@pytest.fixture
+def repo(fake_github):
+    fake_github.add_repo(REPO)
+    fake_github.add_issue(REPO, 3)
+    return REPO
+
+
+@pytest.fixture
+def payload(fake_github, repo, assign_payload) -> bytes:
+    # Point the recorded delivery at a comment that exists in the simulator
+    data = json.loads(assign_payload)
+    data['comment']['id'] = fake_github.add_comment(REPO, 3, data['comment']['body'], login='contributor')
+    return json.dumps(data).encode('utf-8')
+
+
+@pytest.fixture
+def make_server(gh):
+    servers = []
+
+    def make(**kwargs) -> webhook.WebhookServer:
+        # Only the HTTP side runs in the background; tests drive work() so
+        # they know when the queue has been handled
+        server = webhook.WebhookServer(gh, [REPO], SECRET, 0, host='127.0.0.1', **kwargs)
+        threading.Thread(target=server.httpd.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield make
+    for server in servers:
+        server.httpd.shutdown()
+        server.httpd.server_close()
+
+
+def drain(server: webhook.WebhookServer):
+    server.requests.put(None)
+    server.work()
+
+
+def test_verify_signature(assign_payload):
+    assert webhook.verify_signature(SECRET, assign_payload, sign(assign_payload))
+    assert not webhook.verify_signature(SECRET, assign_payload, sign(assign_payload, 'other-secret'))
+    assert not webhook.verify_signature(SECRET, assign_payload, sign(assign_payload)[len('sha256='):])
+    assert not webhook.verify_signature(SECRET, assign_payload, None)
+
+
+def test_parse_assign_request(assign_payload):
+    data = json.loads(assign_payload)
+    assert webhook.parse_assign_request('issue_comment', data) == (REPO, 3, 607206123)
+    assert webhook.parse_assign_request('issues', data) is None
+    assert webhook.parse_assign_request('issue_comment', dict(data, action='edited')) is None
+    assert webhook.parse_assign_request('issue_comment', dict(data, issue=dict(data['issue'], state='closed'))) is None
+    assert webhook.parse_assign_request('issue_comment', dict(data, comment=dict(data['comment'], body='+1'))) is None
+
+
+def test_assigns_commenter(fake_github, make_server, payload):
+    server = make_server()
+    assert deliver(server, payload, sign(payload)) == 202
+    drain(server)
+    assert fake_github.repos[REPO]['issues'][3]['assignees'] == ['contributor']
+
+
+def test_rejects_bad_signature(fake_github, make_server, payload):
+    server = make_server()
+    assert deliver(server, payload, sign(payload, 'other-secret')) == 401
+    assert deliver(server, b'{}', sign(payload)) == 401
+    assert server.requests.empty()
+
+
+def test_rejects_malformed_payload(make_server):
+    server = make_server()
+    body = b'not json'
+    assert deliver(server, body, sign(body)) == 400
+
+
+def test_ignores_unmapped_repo(make_server, payload):
+    server = make_server()
+    data = json.loads(payload)
+    data['repository']['full_name'] = 'someone/else'
+    body = json.dumps(data).encode('utf-8')
+    assert deliver(server, body, sign(body)) == 202
+    assert server.requests.empty()
+
+
+def test_dry_run_does_not_assign(fake_github, make_server, payload):
+    server = make_server(dry_run=True)
+    assert deliver(server, payload, sign(payload)) == 202
+    fake_github.calls.clear()
+    drain(server)
+    assert fake_github.repos[REPO]['issues'][3]['assignees'] == []
+    assert not fake_github.calls
+
+
+def test_full_queue_answers_503(make_server, payload):
+    server = make_server(queue_size=1)
+    assert deliver(server, payload, sign(payload)) == 202
+    assert deliver(server, payload, sign(payload)) == 503
+
+
+def test_worker_survives_unexpected_errors(fake_github, make_server, payload, monkeypatch):
+    server = make_server()
+    assert deliver(server, payload, sign(payload)) == 202
+    assert deliver(server, payload, sign(payload)) == 202
+
+    get_repo = server.gh.get_repo
+    calls = []
+
+    def flaky_get_repo(name):
+        calls.append(name)
+        if len(calls) == 1:
+            raise requests.ConnectionError('connection reset')
+        return get_repo(name)
+
+    monkeypatch.setattr(server.gh, 'get_repo', flaky_get_repo)
+    drain(server)
+    assert len(calls) == 2
+    assert fake_github.repos[REPO]['issues'][3]['assignees'] == ['contributor']
+
+
+def test_stop_does_not_block_on_full_queue(gh, payload):
+    server = webhook.WebhookServer(gh, [REPO], SECRET, 0, host='127.0.0.1', queue_size=1)
+    threading.Thread(target=server.httpd.serve_forever, daemon=True).start()
+    assert deliver(server, payload, sign(payload)) == 202
+    stopper = threading.Thread(target=server.stop, daemon=True)
+    stopper.start()
+    stopper.join(timeout=5)
+    assert not stopper.is_alive()